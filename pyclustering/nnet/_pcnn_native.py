@@ -0,0 +1,59 @@
+"""!
+
+@brief Ahead-of-time compilation of kernels of Pulse Coupled Neural Network.
+@details The module builds native extension 'pcnn_native' in the same folder using Numba, the extension is used by
+         pyclustering.nnet.pcnn if it exists, so simulation does not wait for JIT compilation and does not require Numba
+         at runtime. The extension should be built once on target platform:
+         @code
+             python -m pyclustering.nnet._pcnn_native
+         @endcode
+
+@authors Andrei Novikov (spb.andr@yandex.ru)
+@date 2014-2015
+@copyright GNU Public License
+
+@cond GNU_PUBLIC_LICENSE
+    PyClustering is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+    
+    PyClustering is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+@endcond
+
+"""
+
+import os;
+
+from numba.pycc import CC;
+
+from pyclustering.nnet.pcnn import _pcnn_simulate, _pcnn_kernel_parameters;
+
+
+native_module = CC('pcnn_native');
+native_module.output_dir = os.path.dirname(os.path.abspath(__file__));
+
+
+@native_module.export('simulate', 'void(i8, i4[:], i4[:], b1, i4[:], f4[:,:], i8, f4[:], f4, f4, f4, f4, f4, f4, f4, f4, f4, '
+                                  'f4[:], f4[:], f4[:], u1[:], f4[:], u1[:,:])')
+def simulate(steps, indptr, indices, stencil, offsets, diagonals, quiet_count, stimulus, feeding_weight, linking_weight, VT, AF, AL, AT, B, output_true, output_false,
+             feeding, linking, threshold, outputs, influence, dynamic):
+    """!
+    @brief Performs simulation of pulse coupled neural network without Fast-Linking by serial steps, see _pcnn_simulate() for description of arguments.
+    @details Parameters of the network are passed as separate values in order of fields of _pcnn_kernel_parameters.
+    
+    """
+    
+    params = _pcnn_kernel_parameters(feeding_weight, linking_weight, VT, AF, AL, AT, B, output_true, output_false);
+    
+    _pcnn_simulate(steps, False, indptr, indices, stencil, offsets, diagonals, quiet_count, stimulus, params, feeding, linking, threshold, outputs, influence, dynamic);
+
+
+if __name__ == "__main__":
+    native_module.compile();
@@ -32,24 +32,26 @@ from pyclustering.samples.definitions import IMAGE_SIMPLE_SAMPLES;
 
 from pyclustering.support import read_image, rgb2gray, draw_image_mask_segments;
 
+import numpy;
+import os;
+
 def template_segmentation_image(image, parameters, simulation_time, brightness, scale_color = True, fastlinking = False, show_spikes = False):
     stimulus = read_image(image);
-    stimulus = rgb2gray(stimulus);
+    stimulus = numpy.asarray(rgb2gray(stimulus), dtype = numpy.float64);
     
     if (brightness != None):
-        for pixel_index in range(len(stimulus)):
-            if (stimulus[pixel_index] < brightness): stimulus[pixel_index] = 1;
-            else: stimulus[pixel_index] = 0;
+        stimulus = (stimulus < brightness).astype(numpy.float64);
     else:
-        maximum_stimulus = float(max(stimulus));
-        minimum_stimulus = float(min(stimulus));
-        delta = maximum_stimulus - minimum_stimulus;
-        
-        for pixel_index in range(len(stimulus)):
-            if (scale_color is True):
-                stimulus[pixel_index] = 1.0 - ((float(stimulus[pixel_index]) - minimum_stimulus) / delta);
-            else:
-                stimulus[pixel_index] = float(stimulus[pixel_index]) / 255;
+        if (scale_color is True):
+            minimum_stimulus = stimulus.min();
+            maximum_stimulus = stimulus.max();
+            
+            # 1.0 - (stimulus - min) / (max - min) is evaluated in place to avoid temporary images
+            stimulus -= minimum_stimulus;
+            stimulus *= -1.0 / (maximum_stimulus - minimum_stimulus);
+            stimulus += 1.0;
+        else:
+            stimulus *= 1.0 / 255.0;
     
     if (parameters is None):
         parameters = pcnn_parameters();
@@ -65,12 +67,17 @@ def template_segmentation_image(image, parameters, simulation_time, brightness,
         
         parameters.FAST_LINKING = fastlinking;
     
+    # Stimulus is passed to the network as array without conversion to list, the network converts it to its own type once.
     net = pcnn_network(len(stimulus), stimulus, parameters, conn_type.GRID_EIGHT);
     (t, y) = net.simulate(simulation_time, None, None, True);
     
-    draw_dynamics(t, y, x_title = "Time", y_title = "y(t)");
-    
     ensembles = net.allocate_sync_ensembles();
+    
+    # Drawing can be disabled by environment variable PYCLUSTERING_DRAW=0, for example, for benchmarking.
+    if (os.environ.get("PYCLUSTERING_DRAW", "1") != "1"):
+        return;
+    
+    draw_dynamics(t, y, x_title = "Time", y_title = "y(t)");
     draw_image_mask_segments(image, ensembles);
     
     net.show_time_signal();
@@ -114,15 +121,16 @@ def segmentation_fast_linking_image_fruits():
     template_segmentation_image(IMAGE_SIMPLE_SAMPLES.IMAGE_SIMPLE_FRUITS_SMALL, None, 47, None, False, True, True); 
 
 
-segmentation_image_simple1();
-segmentation_image_simple2();
-segmentation_image_simple6();
-
-segmentation_gray_image_simple1();
-segmentation_gray_image_simple5();
-segmentation_gray_image_beach();
-segmentation_gray_image_building();
-
-segmentation_fast_linking_image_beach();
-segmentation_fast_linking_image_building();
-segmentation_fast_linking_image_fruits();
\ No newline at end of file
+if __name__ == "__main__":
+    segmentation_image_simple1();
+    segmentation_image_simple2();
+    segmentation_image_simple6();
+    
+    segmentation_gray_image_simple1();
+    segmentation_gray_image_simple5();
+    segmentation_gray_image_beach();
+    segmentation_gray_image_building();
+    
+    segmentation_fast_linking_image_beach();
+    segmentation_fast_linking_image_building();
+    segmentation_fast_linking_image_fruits();
\ No newline at end of file
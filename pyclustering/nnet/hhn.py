@@ -28,13 +28,229 @@
 
 from pyclustering.nnet import *;
 
-from scipy.integrate import odeint;
-
 from pyclustering.support import allocate_sync_ensembles;
+from pyclustering.support.jit import jit, prange;
 
 import numpy;
 import random;
 
+from collections import namedtuple;
+
+
+## Parameters of the network in the form that is passed to numerical kernels (see hhn_parameters for description).
+_hnn_kernel_parameters = namedtuple('_hnn_kernel_parameters', [ 'gNa', 'gK', 'gL', 'vNa', 'vK', 'vL', 'vRest', 'Vsyninh', 'Vsynexc',
+                                                                'alfa_inhibitory', 'betta_inhibitory', 'alfa_excitatory', 'betta_excitatory',
+                                                                'w1', 'w2' ]);
+
+
+@jit(cache = True, fastmath = True)
+def _hnn_rhs(v, m, h, n, gNa, gK, gL, vNa, vK, vL, vRest, Iext, Isyn):
+    """!
+    @brief Calculates derivatives of states of Hodgkin-Huxley neurons.
+    @details States and currents can be specified for one neuron as values or for several neurons as arrays.
+             The function is compiled by Numba if it is installed.
+    
+    @param[in] v (array): Membrane potential of neurons.
+    @param[in] m (array): Activation conductance of the sodium channel of neurons.
+    @param[in] h (array): Inactivation conductance of the sodium channel of neurons.
+    @param[in] n (array): Activation conductance of the potassium channel of neurons.
+    @param[in] gNa (double): Maximal conductivity for sodium current.
+    @param[in] gK (double): Maximal conductivity for potassium current.
+    @param[in] gL (double): Maximal conductivity for leakage current.
+    @param[in] vNa (double): Reverse potential of sodium current.
+    @param[in] vK (double): Reverse potential of potassium current.
+    @param[in] vL (double): Reverse potential of leakage current.
+    @param[in] vRest (double): Rest potential.
+    @param[in] Iext (array): External current of neurons.
+    @param[in] Isyn (array): Synaptic current of neurons.
+    
+    @return (tuple) Derivatives (dv, dm, dh, dn) of states of neurons.
+    
+    """
+    
+    # Calculate ion current
+    # gNa * m[i]^3 * h * (v[i] - vNa) + gK * n[i]^4 * (v[i] - vK) + gL  (v[i] - vL)
+    active_sodium_part = gNa * (m ** 3) * h * (v - vNa);
+    inactive_sodium_part = gK * (n ** 4) * (v - vK);
+    active_potassium_part = gL * (v - vL);
+    
+    Iion = active_sodium_part + inactive_sodium_part + active_potassium_part;
+    
+    # Membrane potential
+    dv = -Iion + Iext - Isyn;
+    
+    # Calculate variables
+    potential = v - vRest;
+    am = (2.5 - 0.1 * potential) / (numpy.exp(2.5 - 0.1 * potential) - 1.0);
+    ah = 0.07 * numpy.exp(-potential / 20.0);
+    an = (0.1 - 0.01 * potential) / (numpy.exp(1.0 - 0.1 * potential) - 1.0);
+    
+    bm = 4.0 * numpy.exp(-potential / 18.0);
+    bh = 1.0 / (numpy.exp(3.0 - 0.1 * potential) + 1.0);
+    bn = 0.125 * numpy.exp(-potential / 80.0);
+    
+    dm = am * (1.0 - m) - bm * m;
+    dh = ah * (1.0 - h) - bh * h;
+    dn = an * (1.0 - n) - bn * n;
+    
+    return (dv, dm, dh, dn);
+
+
+@jit(cache = True, fastmath = True)
+def _hnn_alfa_impact(offsets, trace, trace_memory, alfa, betta):
+    """!
+    @brief Calculates sum of alfa-functions of spikes for time moments that are specified relatively to the moment of spike trace.
+    @details Sum of alfa-functions 'alfa * (t - ti) * exp(-betta * (t - ti))' over spikes 'ti' is expressed by two traces of spikes
+             that are known at moment 't0': trace = sum(exp(-betta * (t0 - ti))) and trace_memory = sum((t0 - ti) * exp(-betta * (t0 - ti))),
+             therefore impact at moment 't0 + offset' is 'alfa * (trace_memory + offset * trace) * exp(-betta * offset)'.
+             The function is compiled by Numba if it is installed.
+    
+    @param[in] offsets (array): Time moments where impact should be calculated relatively to the moment of spike trace.
+    @param[in] trace (double): Sum of exponential decays of spikes.
+    @param[in] trace_memory (double): Sum of exponential decays of spikes weighted by time that has passed since spikes.
+    @param[in] alfa (double): Alfa parameter for alfa-function.
+    @param[in] betta (double): Betta parameter for alfa-function.
+    
+    @return (array) Impact of spikes for each time moment.
+    
+    """
+    
+    return alfa * (trace_memory + offsets * trace) * numpy.exp(-betta * offsets);
+
+
+@jit(cache = True, fastmath = True)
+def _hnn_synaptic_weights(link_weight3, params):
+    """!
+    @brief Returns weights of synaptic connections of each neuron of the network (peripheral oscillators followed by two central elements).
+    @details Synaptic current of neuron 'i' is (w_cn1[i] * impact_cn1 + w_cn2[i] * impact_cn2 + w_pn[i] * impact_pn) * (v[i] - reversal[i]),
+             where impacts are sums of alfa-functions of spikes of central element 1, 2 and peripheral oscillators correspondingly.
+             The function is compiled by Numba if it is installed.
+    
+    @param[in] link_weight3 (array): Connection strength from CN2 to each peripheral oscillator.
+    @param[in] params (_hnn_kernel_parameters): Parameters of the network.
+    
+    @return (tuple) Weights (w_cn1, w_cn2, w_pn) and synaptic reversal potential of each neuron.
+    
+    """
+    
+    num_osc = len(link_weight3);
+    
+    w_cn1 = numpy.zeros(num_osc + 2);
+    w_cn2 = numpy.zeros(num_osc + 2);
+    w_pn = numpy.zeros(num_osc + 2);
+    reversal = numpy.full(num_osc + 2, params.Vsyninh);
+    
+    # PN - peripheral neurons are inhibited by both central elements.
+    w_cn1[0:num_osc] = params.w2;
+    w_cn2[0:num_osc] = link_weight3;
+    
+    # CN1 - first central element is excited by peripheral neurons, CN2 - second central element has no synaptic current.
+    w_pn[num_osc] = params.w1;
+    reversal[num_osc] = params.Vsynexc;
+    
+    return (w_cn1, w_cn2, w_pn, reversal);
+
+
+@jit(cache = True, fastmath = True)
+def _hnn_max_synaptic_conductance(offsets, link_weight3, spike_trace, spike_trace_memory, params):
+    """!
+    @brief Returns upper bound of synaptic conductance of neurons of the network during integrated period.
+    @details Synaptic conductance of central element 1 grows with number of peripheral oscillators that generate spikes,
+             therefore it limits integration step of explicit solution for large networks. The function is compiled by Numba if it is installed.
+    
+    @param[in] offsets (array): Time moments of the integrated period relatively to its beginning (see _hnn_rk4()).
+    @param[in] link_weight3 (array): Connection strength from CN2 to each peripheral oscillator.
+    @param[in] spike_trace (array): Sums of exponential decays of spikes of central element 1, 2 and all peripheral oscillators (see _hnn_rk4()).
+    @param[in] spike_trace_memory (array): Sums of exponential decays of spikes weighted by time since spikes in the same layout.
+    @param[in] params (_hnn_kernel_parameters): Parameters of the network.
+    
+    @return (double) Maximal synaptic conductance over neurons and time moments of the period.
+    
+    """
+    
+    impact_cn1 = _hnn_alfa_impact(offsets, spike_trace[0], spike_trace_memory[0], params.alfa_inhibitory, params.betta_inhibitory);
+    impact_cn2 = _hnn_alfa_impact(offsets, spike_trace[1], spike_trace_memory[1], params.alfa_inhibitory, params.betta_inhibitory);
+    impact_pn = _hnn_alfa_impact(offsets, spike_trace[2], spike_trace_memory[2], params.alfa_excitatory, params.betta_excitatory);
+    
+    (w_cn1, w_cn2, w_pn, reversal) = _hnn_synaptic_weights(link_weight3, params);
+    
+    # Impacts and weights are not negative, so maximal weights give upper bound of conductance of each neuron.
+    return numpy.max(w_cn1.max() * impact_cn1 + w_cn2.max() * impact_cn2 + w_pn.max() * impact_pn);
+
+
+@jit(cache = True, fastmath = True, parallel = True)
+def _hnn_rk4(v, m, h, n, offsets, int_step, Iext, link_weight3, spike_trace, spike_trace_memory, params):
+    """!
+    @brief Integrates states of the network (peripheral oscillators followed by two central elements) by Runge-Kutta 4 method with fixed step.
+    @details Neurons interact only via spikes that have been generated before the integrated period, so each neuron is integrated
+             independently and in parallel. The function is compiled by Numba if it is installed.
+    
+    @param[in] v (array): Membrane potential of neurons.
+    @param[in] m (array): Activation conductance of the sodium channel of neurons.
+    @param[in] h (array): Inactivation conductance of the sodium channel of neurons.
+    @param[in] n (array): Activation conductance of the potassium channel of neurons.
+    @param[in] offsets (array): Time moments of the integrated period with half of integration step relatively to its beginning,
+                i.e. start of the period, middle and end of each integration step.
+    @param[in] int_step (double): Integration step.
+    @param[in] Iext (array): External current of neurons.
+    @param[in] link_weight3 (array): Connection strength from CN2 to each peripheral oscillator.
+    @param[in] spike_trace (array): Sums of exponential decays of spikes of central element 1, 2 and all peripheral oscillators
+                at the beginning of the period (see _hnn_alfa_impact()).
+    @param[in] spike_trace_memory (array): Sums of exponential decays of spikes weighted by time since spikes in the same layout.
+    @param[in] params (_hnn_kernel_parameters): Parameters of the network.
+    
+    @return (tuple) New states (v, m, h, n) of neurons.
+    
+    """
+    
+    (gNa, gK, gL, vNa, vK, vL, vRest) = (params.gNa, params.gK, params.gL, params.vNa, params.vK, params.vL, params.vRest);
+    
+    number_int_steps = (len(offsets) - 1) // 2;
+    
+    # Impact of spikes is the same for all neurons, it is calculated for each half of integration step.
+    impact_cn1 = _hnn_alfa_impact(offsets, spike_trace[0], spike_trace_memory[0], params.alfa_inhibitory, params.betta_inhibitory);
+    impact_cn2 = _hnn_alfa_impact(offsets, spike_trace[1], spike_trace_memory[1], params.alfa_inhibitory, params.betta_inhibitory);
+    impact_pn = _hnn_alfa_impact(offsets, spike_trace[2], spike_trace_memory[2], params.alfa_excitatory, params.betta_excitatory);
+    
+    (w_cn1, w_cn2, w_pn, reversal) = _hnn_synaptic_weights(link_weight3, params);
+    
+    next_v = numpy.empty(len(v));
+    next_m = numpy.empty(len(m));
+    next_h = numpy.empty(len(h));
+    next_n = numpy.empty(len(n));
+    
+    for index in prange(len(v)):
+        (vi, mi, hi, ni) = (v[index], m[index], h[index], n[index]);
+        
+        for index_step in range(number_int_steps):
+            g1 = w_cn1[index] * impact_cn1[2 * index_step] + w_cn2[index] * impact_cn2[2 * index_step] + w_pn[index] * impact_pn[2 * index_step];
+            g2 = w_cn1[index] * impact_cn1[2 * index_step + 1] + w_cn2[index] * impact_cn2[2 * index_step + 1] + w_pn[index] * impact_pn[2 * index_step + 1];
+            g3 = w_cn1[index] * impact_cn1[2 * index_step + 2] + w_cn2[index] * impact_cn2[2 * index_step + 2] + w_pn[index] * impact_pn[2 * index_step + 2];
+            
+            (k1v, k1m, k1h, k1n) = _hnn_rhs(vi, mi, hi, ni, gNa, gK, gL, vNa, vK, vL, vRest, Iext[index], g1 * (vi - reversal[index]));
+            
+            (v2, m2, h2, n2) = (vi + 0.5 * int_step * k1v, mi + 0.5 * int_step * k1m, hi + 0.5 * int_step * k1h, ni + 0.5 * int_step * k1n);
+            (k2v, k2m, k2h, k2n) = _hnn_rhs(v2, m2, h2, n2, gNa, gK, gL, vNa, vK, vL, vRest, Iext[index], g2 * (v2 - reversal[index]));
+            
+            (v3, m3, h3, n3) = (vi + 0.5 * int_step * k2v, mi + 0.5 * int_step * k2m, hi + 0.5 * int_step * k2h, ni + 0.5 * int_step * k2n);
+            (k3v, k3m, k3h, k3n) = _hnn_rhs(v3, m3, h3, n3, gNa, gK, gL, vNa, vK, vL, vRest, Iext[index], g2 * (v3 - reversal[index]));
+            
+            (v4, m4, h4, n4) = (vi + int_step * k3v, mi + int_step * k3m, hi + int_step * k3h, ni + int_step * k3n);
+            (k4v, k4m, k4h, k4n) = _hnn_rhs(v4, m4, h4, n4, gNa, gK, gL, vNa, vK, vL, vRest, Iext[index], g3 * (v4 - reversal[index]));
+            
+            vi += int_step / 6.0 * (k1v + 2.0 * k2v + 2.0 * k3v + k4v);
+            mi += int_step / 6.0 * (k1m + 2.0 * k2m + 2.0 * k3m + k4m);
+            hi += int_step / 6.0 * (k1h + 2.0 * k2h + 2.0 * k3h + k4h);
+            ni += int_step / 6.0 * (k1n + 2.0 * k2n + 2.0 * k3n + k4n);
+        
+        next_v[index] = vi;
+        next_m[index] = mi;
+        next_h[index] = hi;
+        next_n[index] = ni;
+    
+    return (next_v, next_m, next_h, next_n);
+
+
 class hhn_parameters:
     """!
     @brief Describes parameters of Hodgkin-Huxley Oscillatory Network.
@@ -43,11 +259,11 @@ class hhn_parameters:
     
     """  
     
-    nu      = random.random() * 2.0 - 1.0;
+    nu      = 0.0;      # intrinsic noise of maximal conductivities, it is generated for each instance of parameters
     
-    gNa     = 120.0 * (1 + 0.02 * nu);  # maximal conductivity for sodium current
-    gK      = 36.0 * (1 + 0.02 * nu);   # maximal conductivity for potassium current
-    gL      = 0.3 * (1 + 0.02 * nu);    # maximal conductivity for leakage current
+    gNa     = 120.0;    # maximal conductivity for sodium current
+    gK      = 36.0;     # maximal conductivity for potassium current
+    gL      = 0.3;      # maximal conductivity for leakage current
     
     vNa     = 50.0;     # [mV] reverse potential of sodium current
     vK      = -77.0;    # [mV] reverse potential of potassium current
@@ -73,29 +289,21 @@ class hhn_parameters:
     deltah = 650.0;     # [ms] period of time when high strength value of synaptic connection exists from CN2 to PN.
     threshold = -10;
     eps = 0.16;
-
-
-class central_element:
-    """!
-    @brief Central element consist of two central neurons that are described by a little bit different dynamic than peripheral.
     
-    @see hhn_network
-    
-    """
     
-    membrane_potential      = 0.0;        # membrane potential of cenral neuron (V)
-    active_cond_sodium      = 0.0;        # activation conductance of the sodium channel (m)
-    inactive_cond_sodium    = 0.0;        # inactivaton conductance of the sodium channel (h)
-    active_cond_potassium   = 0.0;        # inactivaton conductance of the sodium channel (h)
-    
-    pulse_generation_time = None;         # times of pulse generation by central neuron
-    pulse_generation = False;             # spike generation of central neuron
-    
-    def __init__(self):
-        self.pulse_generation_time = [];
-    
-    def __repr__(self):
-        return "%s, %s" % (self.membrane_potential, self.pulse_generation_time);
+    def __init__(self, seed = None):
+        """!
+        @brief Constructor of parameters where maximal conductivities are perturbed by intrinsic noise that is generated for each instance.
+        
+        @param[in] seed (uint): Seed for generator of intrinsic noise, if it is not specified then noise is not reproducible.
+        
+        """
+        
+        self.nu = random.Random(seed).random() * 2.0 - 1.0;
+        
+        self.gNa = 120.0 * (1 + 0.02 * self.nu);
+        self.gK = 36.0 * (1 + 0.02 * self.nu);
+        self.gL = 0.3 * (1 + 0.02 * self.nu);
 
 
 class hhn_network(network, network_interface):
@@ -133,19 +341,33 @@ class hhn_network(network, network_interface):
     _link_activation_time   = None;          # time of set w3 - connection from CN2 to PN for each oscillator.
     _link_weight3           = None;          # connection strength for each oscillator from CN2 to PN.
     
-    _pulse_generation_time  = None;          # time of spike generation for each oscillator.
     _pulse_generation       = None;          # spike generation for each oscillator.
     
     _stimulus = None;               # stimulus of each oscillator
     _noise = None;                  # Noise for each oscillator
     
-    _central_element = None;        # Central element description
+    # States of central element that consists of two central neurons (CN1 and CN2)
+    _cn_membrane_potential      = None;      # membrane potential of central neurons (V)
+    _cn_active_cond_sodium      = None;      # activation conductance of the sodium channel (m)
+    _cn_inactive_cond_sodium    = None;      # inactivaton conductance of the sodium channel (h)
+    _cn_active_cond_potassium   = None;      # activation conductance of the potassium channel (n)
+    
+    _cn_pulse_generation        = None;      # spike generation of central neurons.
+    
+    # Traces of spikes of central element 1, 2 and all peripheral oscillators that define sums of alfa-functions (see _hnn_alfa_impact)
+    _spike_trace                = None;      # sum of exponential decays of spikes
+    _spike_trace_memory         = None;      # sum of exponential decays of spikes weighted by time since spikes
+    _spike_trace_time           = None;      # time moment of the traces
     
     _params = None;                 # parameters of the network
+    _random = None;                 # generator of noise of stimulus
+    
+    _max_int_step = 0.02;           # [ms] maximal integration step that keeps explicit RK4 solution stable
+    _max_int_conductance = 2.4;     # maximal product of integration step and synaptic conductance that keeps explicit RK4 solution stable
     
     _membrane_dynamic_pointer = None;        # final result is stored here.
     
-    def __init__(self, num_osc, stimulus = None, parameters = None, type_conn = None, type_conn_represent = conn_represent.MATRIX):
+    def __init__(self, num_osc, stimulus = None, parameters = None, type_conn = None, type_conn_represent = conn_represent.MATRIX, seed = None):
         """!
         @brief Constructor of oscillatory network based on Hodgkin-Huxley meuron model.
         
@@ -154,35 +376,44 @@ class hhn_network(network, network_interface):
         @param[in] parameters (hhn_parameters): Parameters of the network.
         @param[in] type_conn (conn_type): Type of connections between oscillators in the network (ignored for this type of network).
         @param[in] type_conn_represent (conn_represent): Internal representation of connection in the network: matrix or list.
+        @param[in] seed (uint): Seed for generator of noise of stimulus and of intrinsic noise of default parameters, if it is not specified then noise is not reproducible.
         
         """
           
         super().__init__(num_osc, conn_type.NONE, type_conn_represent);
         
-        self._membrane_potential        = [0.0] * self._num_osc;
-        self._active_cond_sodium        = [0.0] * self._num_osc;
-        self._inactive_cond_sodium      = [0.0] * self._num_osc;
-        self._active_cond_potassium     = [0.0] * self._num_osc;
-        self._link_activation_time      = [0.0] * self._num_osc;
-        self._link_pulse_counter        = [0.0] * self._num_osc;
-        self._link_deactivation_time    = [0.0] * self.num_osc;
-        self._link_weight3              = [0.0] * self._num_osc;
-        self._pulse_generation_time     = [ [] for i in range(self._num_osc) ];
-        self._pulse_generation          = [False] * self._num_osc;
+        self._membrane_potential        = numpy.zeros(self._num_osc);
+        self._active_cond_sodium        = numpy.zeros(self._num_osc);
+        self._inactive_cond_sodium      = numpy.zeros(self._num_osc);
+        self._active_cond_potassium     = numpy.zeros(self._num_osc);
+        self._link_activation_time      = numpy.zeros(self._num_osc);
+        self._link_pulse_counter        = numpy.zeros(self._num_osc);
+        self._link_weight3              = numpy.zeros(self._num_osc);
+        self._pulse_generation          = numpy.zeros(self._num_osc, dtype = bool);
         
-        self._noise = [random.random() * 2.0 - 1.0 for i in range(self._num_osc)];
+        self._noise = numpy.ones(self._num_osc);
         
-        self._central_element = [central_element(), central_element()];
+        self._cn_membrane_potential     = numpy.zeros(2);
+        self._cn_active_cond_sodium     = numpy.zeros(2);
+        self._cn_inactive_cond_sodium   = numpy.zeros(2);
+        self._cn_active_cond_potassium  = numpy.zeros(2);
+        self._cn_pulse_generation       = numpy.zeros(2, dtype = bool);
+        
+        self._spike_trace               = numpy.zeros(3);
+        self._spike_trace_memory        = numpy.zeros(3);
+        self._spike_trace_time          = 0.0;
         
         if (stimulus is None):
-            self._stimulus = [0.0] * self._num_osc;
+            self._stimulus = numpy.zeros(self._num_osc);
         else:
-            self._stimulus = stimulus;
+            self._stimulus = numpy.array(stimulus, dtype = float);
         
         if (parameters is not None):
             self._params = parameters;
         else:
-            self._params = hhn_parameters();
+            self._params = hhn_parameters(seed);
+        
+        self._random = numpy.random.default_rng(seed);
     
     
     def simulate(self, steps, time, solution = solve_type.RK4, collect_dynamic = True):
@@ -244,11 +475,27 @@ class hhn_network(network, network_interface):
             dyn_time = [];
             
         step = time / steps;
-        int_step = step / 10.0;
         
-        for t in numpy.arange(step, time + step, step):
+        # Each step integrates period from its beginning till the last point of the grid 'numpy.arange(t - step, t, step / 10.0)'.
+        int_period = step - step / 10.0;
+        int_step = int_period / math.ceil(int_period / min(step / 10.0, self._max_int_step));
+        
+        simulation_times = step * numpy.arange(1, steps + 1);
+        
+        # Time moments of integration steps and their middles relatively to the beginning of simulation step
+        integration_offsets = 0.5 * int_step * numpy.arange(2 * int(round(int_period / int_step)) + 1);
+        
+        # Decay of traces of spikes of central element 1, 2 and peripheral oscillators during one step (see _hnn_alfa_impact)
+        trace_attenuation = numpy.exp(-step * numpy.array([self._params.betta_inhibitory, self._params.betta_inhibitory, self._params.betta_excitatory]));
+        
+        # Noise of stimulus is generated once for the whole simulation, one row per step
+        noise_trace = 1.0 + 0.01 * self._random.uniform(-1.0, 1.0, (len(simulation_times), self._num_osc));
+        
+        for (index_step, t) in enumerate(simulation_times):
+            self._noise = noise_trace[index_step];
+            
             # update states of oscillators
-            memb = self._calculate_states(solution, t, step, int_step);
+            memb = self._calculate_states(solution, t, step, int_step, integration_offsets, trace_attenuation);
             
             # update states of oscillators
             if (collect_dynamic == True):
@@ -262,7 +509,7 @@ class hhn_network(network, network_interface):
         return (dyn_time, dyn_memb);
     
     
-    def _calculate_states(self, solution, t, step, int_step):
+    def _calculate_states(self, solution, t, step, int_step, integration_offsets, trace_attenuation):
         """!
         @brief Caclculates new state of each oscillator in the network. Returns only excitatory state of oscillators.
         
@@ -270,179 +517,158 @@ class hhn_network(network, network_interface):
         @param[in] t (double): Current time of simulation.
         @param[in] step (uint): Step of solution at the end of which states of oscillators should be calculated.
         @param[in] int_step (double): Differentiation step that is used for solving differential equation.
+        @param[in] integration_offsets (array): Time moments of integration steps and their middles relatively to the beginning of the step.
+        @param[in] trace_attenuation (array): Decay of traces of spikes of central element 1, 2 and peripheral oscillators during the step.
         
         @return (list) New states of membrance potentials for peripheral oscillators and for cental elements as a list where
                 the last two values correspond to central element 1 and 2.
                  
         """
         
-        next_membrane           = [0.0] * self._num_osc;
-        next_active_sodium      = [0.0] * self._num_osc;
-        next_inactive_sodium    = [0.0] * self._num_osc;
-        next_active_potassium   = [0.0] * self._num_osc;
-        
-        # Update states of oscillators
-        for index in range (0, self._num_osc, 1):
-            result = odeint(self.hnn_state, 
-                            [ self._membrane_potential[index], self._active_cond_sodium[index], self._inactive_cond_sodium[index], self._active_cond_potassium[index] ], 
-                            numpy.arange(t - step, t, int_step), 
-                            (index , ));
-                            
-            [ next_membrane[index], next_active_sodium[index], next_inactive_sodium[index], next_active_potassium[index] ] = result[len(result) - 1][0:4];        
-        
-        next_cn_membrane            = [0.0, 0.0];
-        next_cn_active_sodium       = [0.0, 0.0];
-        next_cn_inactive_sodium     = [0.0, 0.0];
-        next_cn_active_potassium    = [0.0, 0.0];
-        
-        # Update states of central elements
-        for index in range(0, len(self._central_element)):
-            result = odeint(self.hnn_state, 
-                            [ self._central_element[index].membrane_potential, self._central_element[index].active_cond_sodium, self._central_element[index].inactive_cond_sodium, self._central_element[index].active_cond_potassium ], 
-                            numpy.arange(t - step, t, int_step), 
-                            (self._num_osc + index , ));
-                            
-            [ next_cn_membrane[index], next_cn_active_sodium[index], next_cn_inactive_sodium[index], next_cn_active_potassium[index] ] = result[len(result) - 1][0:4];
-        
-        # Noise generation
-        self._noise = [ 1.0 + 0.01 * (random.random() * 2.0 - 1.0) for i in range(self._num_osc)];
-        
-        # Updating states of PNs
-        for index in range(0, self._num_osc):
-            if (self._pulse_generation[index] is False):
-                if (next_membrane[index] > 0.0):
-                    self._pulse_generation[index] = True;
-                    self._pulse_generation_time[index].append(t);
-            else:
-                if (next_membrane[index] < 0.0):
-                    self._pulse_generation[index] = False;
+        num_osc = self._num_osc;
+        params = self._params;
+        
+        link_weight3 = self._link_weight3;
+        link_pulse_counter = self._link_pulse_counter;
+        link_activation_time = self._link_activation_time;
+        
+        # States of peripheral oscillators and central elements are integrated together, where each state consists of
+        # values of peripheral oscillators followed by values of central elements.
+        v = numpy.concatenate((self._membrane_potential, self._cn_membrane_potential));
+        m = numpy.concatenate((self._active_cond_sodium, self._cn_active_cond_sodium));
+        h = numpy.concatenate((self._inactive_cond_sodium, self._cn_inactive_cond_sodium));
+        n = numpy.concatenate((self._active_cond_potassium, self._cn_active_cond_potassium));
+        
+        kernel_params = self.__kernel_parameters();
+        
+        # Synaptic conductance grows with number of spikes of peripheral oscillators, therefore integration step is decreased
+        # for the period when it is too large for stable explicit solution.
+        conductance = _hnn_max_synaptic_conductance(integration_offsets, link_weight3, self._spike_trace, self._spike_trace_memory, kernel_params);
+        if (conductance * int_step > self._max_int_conductance):
+            int_period = integration_offsets[-1];
+            number_int_steps = math.ceil(int_period * conductance / self._max_int_conductance);
             
-            # Update connection from CN2 to PN
-            if (self._link_weight3[index] == 0.0):
-                if ( (next_membrane[index] > self._params.threshold) and (next_membrane[index] > self._params.threshold) ):
-                    self._link_pulse_counter[index] += step;
-                
-                    if (self._link_pulse_counter[index] >= 1 / self._params.eps):
-                        self._link_weight3[index] = self._params.w3;
-                        self._link_activation_time[index] = t;
-            else:
-                if ( not ((self._link_activation_time[index] < t) and (t < self._link_activation_time[index] + self._params.deltah)) ):
-                    self._link_weight3[index] = 0.0;
-                    self._link_pulse_counter[index] = 0.0;
-                    
+            int_step = int_period / number_int_steps;
+            integration_offsets = 0.5 * int_step * numpy.arange(2 * number_int_steps + 1);
+        
+        (next_v, next_m, next_h, next_n) = _hnn_rk4(v, m, h, n, integration_offsets, int_step, self.__external_current(), 
+                                                    link_weight3, self._spike_trace, self._spike_trace_memory, kernel_params);
+        
+        next_membrane           = next_v[0:num_osc];
+        next_active_sodium      = next_m[0:num_osc];
+        next_inactive_sodium    = next_h[0:num_osc];
+        next_active_potassium   = next_n[0:num_osc];
+        
+        next_cn_membrane            = next_v[num_osc:];
+        next_cn_active_sodium       = next_m[num_osc:];
+        next_cn_inactive_sodium     = next_h[num_osc:];
+        next_cn_active_potassium    = next_n[num_osc:];
         
+        # Updating states of PNs: spike is registered when membrane potential crosses zero from below
+        rising = ~self._pulse_generation & (next_membrane > 0.0);
+        falling = self._pulse_generation & (next_membrane < 0.0);
+        self._pulse_generation = (self._pulse_generation | rising) & ~falling;
+        
+        # Update connection from CN2 to PN
+        unlinked = (link_weight3 == 0.0);
+        expired = ~unlinked & ~((link_activation_time < t) & (t < link_activation_time + params.deltah));
+        
+        link_pulse_counter[unlinked & (next_membrane > params.threshold)] += step;
+        
+        activated = unlinked & (link_pulse_counter >= 1.0 / params.eps);
+        link_weight3[activated] = params.w3;
+        link_activation_time[activated] = t;
+        
+        link_weight3[expired] = 0.0;
+        link_pulse_counter[expired] = 0.0;
         
         # Updation states of CN
-        for index in range(0, len(self._central_element)):
-            if (self._central_element[index].pulse_generation is False):
-                if (next_cn_membrane[index] > 0.0):
-                    self._central_element[index].pulse_generation = True;
-                    self._central_element[index].pulse_generation_time.append(t);
-            else:
-                if (next_cn_membrane[index] < 0.0):
-                    self._central_element[index].pulse_generation = False;
-            
-            self._central_element[index].membrane_potential = next_cn_membrane[index];
-            self._central_element[index].active_cond_sodium = next_cn_active_sodium[index];
-            self._central_element[index].inactive_cond_sodium = next_cn_inactive_sodium[index];
-            self._central_element[index].active_cond_potassium = next_cn_active_potassium[index];
+        cn_rising = ~self._cn_pulse_generation & (next_cn_membrane > 0.0);
+        cn_falling = self._cn_pulse_generation & (next_cn_membrane < 0.0);
+        self._cn_pulse_generation = (self._cn_pulse_generation | cn_rising) & ~cn_falling;
+        
+        # New states are views of arrays that are created by the integration kernel on each step, so they are not copied.
+        self._cn_membrane_potential = next_cn_membrane;
+        self._cn_active_cond_sodium = next_cn_active_sodium;
+        self._cn_inactive_cond_sodium = next_cn_inactive_sodium;
+        self._cn_active_cond_potassium = next_cn_active_potassium;
         
-        self._membrane_potential = next_membrane[:];
-        self._active_cond_sodium = next_active_sodium[:];
-        self._inactive_cond_sodium = next_inactive_sodium[:];
-        self._active_cond_potassium = next_active_potassium[:];
+        # Traces of spikes are moved to the end of the step, new spikes are added with zero time since spike
+        self._spike_trace_memory = (self._spike_trace_memory + step * self._spike_trace) * trace_attenuation;
+        self._spike_trace = self._spike_trace * trace_attenuation + numpy.array([cn_rising[0], cn_rising[1], numpy.count_nonzero(rising)], dtype = float);
+        self._spike_trace_time = t;
         
-        return next_membrane + next_cn_membrane;
+        self._membrane_potential = next_membrane;
+        self._active_cond_sodium = next_active_sodium;
+        self._inactive_cond_sodium = next_inactive_sodium;
+        self._active_cond_potassium = next_active_potassium;
+        
+        return next_v.tolist();
     
     
-    def hnn_state(self, inputs, t, argv):
+    def hnn_state(self, inputs, t, argv = None):
         """!
-        @brief Returns new values of excitatory and inhibitory parts of oscillator and potential of oscillator.
+        @brief Returns derivatives of states of the whole network: peripheral oscillators and central elements, or of one oscillator if its index is specified.
         
-        @param[in] inputs (list): States of oscillator for integration [v, m, h, n] (see description below).
+        @param[in] inputs (array): States of the network for integration [V, m, h, n] where each block consists of
+                   values of peripheral oscillators followed by values of central elements (see description below).
+                   If index of oscillator is specified then states of the oscillator [v, m, h, n].
         @param[in] t (double): Current time of simulation.
-        @param[in] argv (tuple): Extra arguments that are not used for integration - index of oscillator.
+        @param[in] argv (uint): Index of oscillator whose derivatives are returned, where indexes of central element 1 and 2 follow
+                   indexes of peripheral oscillators. Other oscillators are considered in their current states.
         
-        @return (list) new values of oscillator [v, m, h, n], where:
-                v - membrane potantial of oscillator,
+        @return (array) Derivatives of the states [dV, dm, dh, dn] in the same layout as input, where:
+                V - membrane potantial of oscillators,
                 m - activation conductance of the sodium channel,
                 h - inactication conductance of the sodium channel,
                 n - activation conductance of the potassium channel.
         
         """
         
-        index = argv;
+        if (argv is not None):
+            index = argv;
+            
+            states = numpy.concatenate((self._membrane_potential, self._cn_membrane_potential, self._active_cond_sodium, self._cn_active_cond_sodium,
+                                        self._inactive_cond_sodium, self._cn_inactive_cond_sodium, self._active_cond_potassium, self._cn_active_cond_potassium));
+            
+            states[index::self._num_osc + 2] = inputs;
+            
+            return self.hnn_state(states, t)[index::self._num_osc + 2].tolist();
         
-        v = inputs[0]; # membrane potential (v).
-        m = inputs[1]; # activation conductance of the sodium channel (m).
-        h = inputs[2]; # inactivaton conductance of the sodium channel (h).
-        n = inputs[3]; # activation conductance of the potassium channel (n).
+        (v, m, h, n) = numpy.reshape(numpy.asarray(inputs, dtype = float), (4, self._num_osc + 2));
         
-        # Calculate ion current
-        # gNa * m[i]^3 * h * (v[i] - vNa) + gK * n[i]^4 * (v[i] - vK) + gL  (v[i] - vL)
-        active_sodium_part = self._params.gNa * (m ** 3) * h * (v - self._params.vNa);
-        inactive_sodium_part = self._params.gK * (n ** 4) * (v - self._params.vK);
-        active_potassium_part = self._params.gL * (v - self._params.vL);
+        params = self.__kernel_parameters();
         
-        Iion = active_sodium_part + inactive_sodium_part + active_potassium_part;
+        offset = t - self._spike_trace_time;
+        impact_cn1 = _hnn_alfa_impact(offset, self._spike_trace[0], self._spike_trace_memory[0], params.alfa_inhibitory, params.betta_inhibitory);
+        impact_cn2 = _hnn_alfa_impact(offset, self._spike_trace[1], self._spike_trace_memory[1], params.alfa_inhibitory, params.betta_inhibitory);
+        impact_pn = _hnn_alfa_impact(offset, self._spike_trace[2], self._spike_trace_memory[2], params.alfa_excitatory, params.betta_excitatory);
         
-        Iext = 0.0;
-        Isyn = 0.0;
-        if (index < self._num_osc): 
-            # PN - peripheral neuron - calculation of external current and synaptic current.
-            Iext = self._stimulus[index] * self._noise[index];    # probably noise can be pre-defined for reducting compexity            
-            
-            memory_impact1 = 0.0;
-            for i in range(0, len(self._central_element[0].pulse_generation_time)):
-                # TODO: alfa function shouldn't be calculated here (long procedure)
-                memory_impact1 += self.__alfa_function(t - self._central_element[0].pulse_generation_time[i], self._params.alfa_inhibitory, self._params.betta_inhibitory);
-            
-            memory_impact2 = 0.0;
-            for i in range(0, len(self._central_element[1].pulse_generation_time)):
-                # TODO: alfa function shouldn't be calculated here (long procedure)
-                memory_impact2 += self.__alfa_function(t - self._central_element[1].pulse_generation_time[i], self._params.alfa_inhibitory, self._params.betta_inhibitory);        
-    
-            Isyn = self._params.w2 * (v - self._params.Vsyninh) * memory_impact1 + self._link_weight3[index] * (v - self._params.Vsyninh) * memory_impact2;            
-        else:
-            # CN - central element.
-            central_index = index - self._num_osc;
-            if (central_index == 0):
-                Iext = self._params.Icn1;   # CN1
-                
-                memory_impact = 0.0;
-                for index_oscillator in range(0, self._num_osc):
-                    for index_generation in range(0, len(self._pulse_generation_time[index_oscillator])):
-                        # TODO: alfa function shouldn't be calculated here (long procedure)
-                        memory_impact += self.__alfa_function(t - self._pulse_generation_time[index_oscillator][index_generation], self._params.alfa_excitatory, self._params.betta_excitatory);
-                 
-                Isyn = self._params.w1 * (v - self._params.Vsynexc) * memory_impact;
-                
-            elif (central_index == 1):
-                Iext = self._params.Icn2;   # CN2
-                Isyn = 0.0;
-                
-            else:
-                assert 0;
+        (w_cn1, w_cn2, w_pn, reversal) = _hnn_synaptic_weights(self._link_weight3, params);
+        Isyn = (w_cn1 * impact_cn1 + w_cn2 * impact_cn2 + w_pn * impact_pn) * (v - reversal);
         
+        derivatives = _hnn_rhs(v, m, h, n, params.gNa, params.gK, params.gL, params.vNa, params.vK, params.vL, params.vRest,
+                               self.__external_current(), Isyn);
         
-        # Membrane potential
-        dv = -Iion + Iext - Isyn;
+        return numpy.concatenate(derivatives);
+    
+    
+    def __external_current(self):
+        """!
+        @brief Returns external current of peripheral oscillators (stimulus with noise) followed by external current of central elements.
         
-        # Calculate variables
-        potential = v - self._params.vRest;
-        am = (2.5 - 0.1 * potential) / (math.exp(2.5 - 0.1 * potential) - 1.0);
-        ah = 0.07 * math.exp(-potential / 20.0);
-        an = (0.1 - 0.01 * potential) / (math.exp(1.0 - 0.1 * potential) - 1.0);
+        """
         
-        bm = 4.0 * math.exp(-potential / 18.0);
-        bh = 1.0 / (math.exp(3.0 - 0.1 * potential) + 1.0);
-        bn = 0.125 * math.exp(-potential / 80.0);
+        return numpy.concatenate((self._stimulus * self._noise, [self._params.Icn1, self._params.Icn2]));
+    
+    
+    def __kernel_parameters(self):
+        """!
+        @brief Returns parameters of the network in the form that is expected by numerical kernels.
         
-        dm = am * (1.0 - m) - bm * m;
-        dh = ah * (1.0 - h) - bh * h;
-        dn = an * (1.0 - n) - bn * n;
+        """
         
-        return [dv, dm, dh, dn];
+        return _hnn_kernel_parameters(*(float(getattr(self._params, name)) for name in _hnn_kernel_parameters._fields));
         
         
     def allocate_sync_ensembles(self, tolerance = 0.1):
@@ -461,19 +687,3 @@ class hhn_network(network, network_interface):
         ignore.add(self._num_osc + 1);
         
         return allocate_sync_ensembles(self._membrane_dynamic_pointer, tolerance, 20.0, ignore);
-    
-    
-    def __alfa_function(self, time, alfa, betta):
-        """!
-        @brief Calculates value of alfa-function for difference between spike generation time and current simulation time.
-        
-        @param[in] time (double): Difference between last spike generation time and current time.
-        @param[in] alfa (double): Alfa parameter for alfa-function.
-        @param[in] betta (double): Betta parameter for alfa-function.
-        
-        @return (double) Value of alfa-function.
-        
-        """
-        
-        return alfa * time * math.exp(-betta * time);
-    
\ No newline at end of file
@@ -27,10 +27,23 @@
 """
 
 import matplotlib.pyplot as plt;
-import random;
+import numpy;
+import itertools;
+
+from collections import namedtuple;
+
+from scipy.sparse import csr_matrix;
 
 from pyclustering.nnet import *;
 
+from pyclustering.support.jit import jit, prange, cuda, NUMBA_AVAILABLE, CUDA_AVAILABLE;
+
+# Precompiled simulation kernel is used if it has been built (see pyclustering.nnet._pcnn_native).
+try:
+    from pyclustering.nnet.pcnn_native import simulate as _pcnn_simulate_native;
+except ImportError:
+    _pcnn_simulate_native = None;
+
 
 class pcnn_parameters:
     """!
@@ -58,6 +71,268 @@ class pcnn_parameters:
     FAST_LINKING = False;   # enable/disable Fast-Linking mode
     
 
+## Parameters of the network in the form that is passed to numerical kernels (see pcnn_parameters for description),
+## FEEDING_WEIGHT is M * VF and LINKING_WEIGHT is W * VL.
+_pcnn_kernel_parameters = namedtuple('_pcnn_kernel_parameters', [ 'FEEDING_WEIGHT', 'LINKING_WEIGHT', 'VT', 'AF', 'AL', 'AT', 'B', 'OUTPUT_TRUE', 'OUTPUT_FALSE' ]);
+
+
+@jit(cache = True)
+def _pcnn_influence(indptr, indices, outputs, influence):
+    """!
+    @brief Calculates sum of outputs of neighbors for each oscillator of pulse coupled neural network.
+    @details Only active oscillators are considered: output of each of them is added to oscillators that it influences,
+             so amount of work is proportional to number of spikes instead of number of connections.
+             The function is compiled by Numba if it is installed.
+    
+    @param[in] indptr (array): Index pointers of the connection matrix in CSC format: oscillators that are influenced by 'j' are indices[indptr[j]:indptr[j + 1]].
+    @param[in] indices (array): Indexes of influenced oscillators of the connection matrix in CSC format.
+    @param[in] outputs (array): Output of each oscillator.
+    @param[out] influence (array): Sum of outputs of neighbors of each oscillator.
+    
+    """
+    
+    influence[:] = 0;
+    for index in range(len(outputs)):
+        if (outputs[index] != 0):
+            for index_receiver in range(indptr[index], indptr[index + 1]):
+                influence[indices[index_receiver]] += outputs[index];
+
+
+@jit(cache = True, fastmath = True)
+def _pcnn_influence_stencil(offsets, diagonals, outputs, influence):
+    """!
+    @brief Calculates sum of outputs of neighbors for each oscillator of pulse coupled neural network whose connections
+           are located on a few diagonals of the connection matrix, for example, grid where neighbors have constant offsets.
+    @details Each diagonal is processed by contiguous loop without indirect indexing of neighbors.
+             The function is compiled by Numba if it is installed.
+    
+    @param[in] offsets (array): Offsets of diagonals of the connection matrix in DIA format: neighbor of oscillator 'i' is 'i + offset'.
+    @param[in] diagonals (array): Values of the diagonals in DIA format where element [k][j] corresponds to connection between 'j - offsets[k]' and 'j'.
+    @param[in] outputs (array): Output of each oscillator.
+    @param[out] influence (array): Sum of outputs of neighbors of each oscillator.
+    
+    """
+    
+    size = len(outputs);
+    influence[:] = 0;
+    
+    for index_diagonal in range(len(offsets)):
+        offset = offsets[index_diagonal];
+        (begin, end) = (max(0, -offset), min(size, size - offset));
+        
+        # Views without overlapping are used, so the loop is vectorized.
+        influence_view = influence[begin:end];
+        outputs_view = outputs[begin + offset:end + offset];
+        weights_view = diagonals[index_diagonal, begin + offset:end + offset];
+        
+        for index in range(len(influence_view)):
+            influence_view[index] += weights_view[index] * outputs_view[index];
+
+
+@jit(cache = True)
+def _pcnn_influence_quiet(indptr, indices, stencil, offsets, diagonals, quiet_count, outputs, influence):
+    """!
+    @brief Calculates sum of outputs of neighbors for each oscillator of pulse coupled neural network by the most suitable way:
+           using only connections of active oscillators if there are a few of them, otherwise using stencil if it is available.
+    @details The function is compiled by Numba if it is installed.
+    
+    @param[in] indptr (array): Index pointers of the connection matrix in CSC format (see _pcnn_influence()).
+    @param[in] indices (array): Indexes of influenced oscillators of the connection matrix in CSC format.
+    @param[in] stencil (bool): If True then diagonals of the connection matrix are available.
+    @param[in] offsets (array): Offsets of diagonals of the connection matrix in DIA format (see _pcnn_influence_stencil()).
+    @param[in] diagonals (array): Values of diagonals of the connection matrix in DIA format.
+    @param[in] quiet_count (uint): Maximal number of active oscillators when only their connections are used.
+    @param[in] outputs (array): Output of each oscillator.
+    @param[out] influence (array): Sum of outputs of neighbors of each oscillator.
+    
+    """
+    
+    if ( (stencil is True) and (numpy.count_nonzero(outputs) > quiet_count) ):
+        _pcnn_influence_stencil(offsets, diagonals, outputs, influence);
+    else:
+        _pcnn_influence(indptr, indices, outputs, influence);
+
+
+@jit(cache = True, fastmath = True)
+def _pcnn_oscillator_step(index, influence, stimulus, feeding, linking, threshold, outputs, params):
+    """!
+    @brief Calculates new state of oscillator with specified index of pulse coupled neural network in-place (see _pcnn_step()).
+    @details The function is compiled by Numba if it is installed.
+    
+    """
+    
+    feeding[index] = params.AF * feeding[index] + stimulus[index] + influence[index] * params.FEEDING_WEIGHT;
+    linking[index] = params.AL * linking[index] + influence[index] * params.LINKING_WEIGHT;
+    
+    # calculate internal activity and output of the oscillator
+    internal_activity = feeding[index] * (1.0 + params.B * linking[index]);
+    if (internal_activity > threshold[index]):
+        outputs[index] = params.OUTPUT_TRUE;
+    else:
+        outputs[index] = params.OUTPUT_FALSE;
+    
+    threshold[index] = params.AT * threshold[index] + params.VT * outputs[index];
+
+
+@jit(cache = True, fastmath = True)
+def _pcnn_step(influence, stimulus, feeding, linking, threshold, outputs, params):
+    """!
+    @brief Calculates new states of oscillators of pulse coupled neural network in one pass.
+    @details States are updated in-place because state of each oscillator depends only on its own previous state and on influence
+             of neighbors that is calculated before the step. The function is compiled by Numba if it is installed.
+    
+    @param[in] influence (array): Sum of outputs of neighbors of each oscillator at the previous step (see _pcnn_influence()).
+    @param[in] stimulus (array): Stimulus of each oscillator.
+    @param[in|out] feeding (array): Feeding compartment of each oscillator.
+    @param[in|out] linking (array): Linking compartment of each oscillator.
+    @param[in|out] threshold (array): Threshold of each oscillator.
+    @param[out] outputs (array): Output of each oscillator.
+    @param[in] params (_pcnn_kernel_parameters): Parameters of the network.
+    
+    """
+    
+    for index in range(len(stimulus)):
+        _pcnn_oscillator_step(index, influence, stimulus, feeding, linking, threshold, outputs, params);
+
+
+@jit(cache = True, fastmath = True, parallel = True)
+def _pcnn_step_parallel(influence, stimulus, feeding, linking, threshold, outputs, params):
+    """!
+    @brief Calculates new states of oscillators of pulse coupled neural network in parallel, arguments are the same as for _pcnn_step().
+    @details Oscillators depend only on states of the previous step, so they are independent within the step.
+             The function is compiled by Numba if it is installed.
+    
+    """
+    
+    for index in prange(len(stimulus)):
+        _pcnn_oscillator_step(index, influence, stimulus, feeding, linking, threshold, outputs, params);
+
+
+@jit(cache = True)
+def _pcnn_simulate(steps, parallel, indptr, indices, stencil, offsets, diagonals, quiet_count, stimulus, params, feeding, linking, threshold, outputs, influence, dynamic):
+    """!
+    @brief Performs specified number of steps of simulation of pulse coupled neural network without Fast-Linking in one call.
+    @details States of oscillators are updated in-place (see _pcnn_step()). The function is compiled by Numba if it is installed.
+    
+    @param[in] steps (uint): Number of steps of simulation.
+    @param[in] parallel (bool): If True then states of oscillators are calculated in parallel on each step.
+    @param[in] indptr (array): Index pointers of the connection matrix in CSC format (see _pcnn_influence()).
+    @param[in] indices (array): Indexes of influenced oscillators of the connection matrix in CSC format.
+    @param[in] stencil (bool): If True then influence may be calculated using diagonals of the connection matrix instead of CSC format.
+    @param[in] offsets (array): Offsets of diagonals of the connection matrix in DIA format (see _pcnn_influence_stencil()).
+    @param[in] diagonals (array): Values of diagonals of the connection matrix in DIA format.
+    @param[in] quiet_count (uint): Maximal number of active oscillators when influence is calculated only by their connections (see _pcnn_influence_quiet()).
+    @param[in] stimulus (array): Stimulus of each oscillator.
+    @param[in] params (_pcnn_kernel_parameters): Parameters of the network.
+    @param[in|out] feeding (array): Feeding compartment of each oscillator.
+    @param[in|out] linking (array): Linking compartment of each oscillator.
+    @param[in|out] threshold (array): Threshold of each oscillator.
+    @param[in|out] outputs (array): Output of each oscillator.
+    @param[out] influence (array): Buffer for sum of outputs of neighbors of each oscillator.
+    @param[out] dynamic (array): Outputs of oscillators after each step are written to rows starting from the second one,
+                 if the array has no rows then outputs are not collected.
+    
+    """
+    
+    for step in range(steps):
+        _pcnn_influence_quiet(indptr, indices, stencil, offsets, diagonals, quiet_count, outputs, influence);
+        
+        if (parallel is True):
+            _pcnn_step_parallel(influence, stimulus, feeding, linking, threshold, outputs, params);
+        else:
+            _pcnn_step(influence, stimulus, feeding, linking, threshold, outputs, params);
+        
+        if (dynamic.shape[0] > 0):
+            dynamic[step + 1, :] = outputs;
+
+
+if (CUDA_AVAILABLE is True):
+    from numba import float32;
+    
+    @cuda.jit
+    def _pcnn_step_cuda(indptr, indices, outputs, stimulus, feeding, linking, threshold, feeding_weight, linking_weight, VT, AF, AL, AT, B, output_true, output_false,
+                        outputs_next):
+        """!
+        @brief Calculates new states of oscillators of pulse coupled neural network on CUDA device, each thread processes one oscillator.
+        @details Arguments are the same as for _pcnn_step() except influence of neighbors that is calculated using connections in CSR format
+                 and parameters of the network that are passed as separate values in order of fields of _pcnn_kernel_parameters.
+                 Outputs of neighbors are read by other threads, so new outputs are written to separate buffer.
+        
+        """
+        
+        index = cuda.grid(1);
+        if (index < stimulus.shape[0]):
+            influence = float32(0.0);
+            for index_neighbor in range(indptr[index], indptr[index + 1]):
+                influence += outputs[indices[index_neighbor]];
+            
+            feeding_value = AF * feeding[index] + stimulus[index] + influence * feeding_weight;
+            linking_value = AL * linking[index] + influence * linking_weight;
+            
+            output_value = output_false;
+            if (feeding_value * (float32(1.0) + B * linking_value) > threshold[index]):
+                output_value = output_true;
+            
+            feeding[index] = feeding_value;
+            linking[index] = linking_value;
+            outputs_next[index] = output_value;
+            threshold[index] = AT * threshold[index] + VT * output_value;
+
+
+def _pcnn_sync_ensembles(dynamic, output_true):
+    """!
+    @brief Allocates ensembles of synchronous oscillators using output dynamic of pulse coupled neural network (see pcnn_network.allocate_sync_ensembles()).
+    
+    @param[in] dynamic (array): Output dynamic [steps + 1 x number of oscillators].
+    @param[in] output_true (double): Fire value of oscillators.
+    
+    @return (list) Groups (lists) of indexes of synchronous oscillators.
+    
+    """
+    
+    sync_ensembles = [];
+    traverse_oscillators = numpy.zeros(dynamic.shape[1], dtype = bool);
+    
+    # Oscillator belongs to the ensemble of its last spike, the initial state is not considered.
+    for spikes in (dynamic[:0:-1] == output_true):
+        sync_ensemble = numpy.flatnonzero(spikes & ~traverse_oscillators);
+        
+        if (len(sync_ensemble) > 0):
+            sync_ensembles.append(sync_ensemble.tolist());
+            traverse_oscillators |= spikes;
+    
+    return sync_ensembles;
+
+
+def _pcnn_spike_ensembles(dynamic, output_true):
+    """!
+    @brief Allocates spikes on each iteration as lists of indexes of oscillators using output dynamic of pulse coupled neural network (see pcnn_network.allocate_spike_ensembles()).
+    
+    @param[in] dynamic (array): Output dynamic [steps + 1 x number of oscillators].
+    @param[in] output_true (double): Fire value of oscillators.
+    
+    @return (list) Spike ensembles of oscillators.
+    
+    """
+    
+    return [ numpy.flatnonzero(spikes).tolist() for spikes in (dynamic == output_true) if spikes.any() ];
+
+
+@jit(cache = True, parallel = True)
+def _pcnn_simulate_batch(steps, indptr, indices, stencil, offsets, diagonals, quiet_count, stimulus, params, feeding, linking, threshold, outputs, influence, dynamic):
+    """!
+    @brief Performs simulation of batch of independent pulse coupled neural networks with the same connections in parallel, each network is simulated by _pcnn_simulate().
+    @details Arguments are the same as for _pcnn_simulate() except states, stimulus and influence that are arrays [number of networks x number of oscillators]
+             and dynamic that is array [steps + 1 x number of networks x number of oscillators]. The function is compiled by Numba if it is installed.
+    
+    """
+    
+    for index_network in prange(stimulus.shape[0]):
+        _pcnn_simulate(steps, False, indptr, indices, stencil, offsets, diagonals, quiet_count, stimulus[index_network], params,
+                       feeding[index_network], linking[index_network], threshold[index_network], outputs[index_network],
+                       influence[index_network], dynamic[:, index_network, :]);
+
+
 class pcnn_network(network, network_interface):
     """!
     @brief Model of oscillatory network that is based on the Eckhorn model.
@@ -67,17 +342,34 @@ class pcnn_network(network, network_interface):
     # Protected members:
     _name = "Pulse Coupled Neural Network";
     _stimulus = None;           # stimulus of each oscillator.
-    _outputs = None;            # list of outputs of oscillors.
+    _outputs = None;            # outputs of oscillators.
     _pointer_dynamic = None;    # pointer to output dynamics.
     
     _feeding = None;            # feeding compartment of each oscillator.    
     _linking = None;            # linking compartment of each oscillator. 
     _threshold = None;          # threshold of each oscillator.
     
+    _outputs_next = None;       # buffer where outputs are calculated if outputs of the previous step are required, it is swapped with outputs.
+    
+    _connections = None;        # sparse (CSR) matrix of connections between oscillators that is used for calculation of influence of neighbors.
+    _receivers = None;          # the same connections in CSC format: column 'j' contains oscillators that are influenced by oscillator 'j'.
+    _influence = None;          # buffer for sum of outputs of neighbors of each oscillator.
+    _stencil = None;            # the same connections in DIA format if they are located on a few diagonals (constant offsets of neighbors, e.g. grid), otherwise None.
+    
+    _stencil_max_offsets = 8;   # maximal number of diagonals of the connection matrix for calculation of influence by the stencil.
+    _quiet_ratio = 0.03;        # maximal fraction of active oscillators when influence is calculated only by connections of active oscillators.
+    
+    _parallel_threshold = 4096; # minimal number of oscillators for parallel calculation of states, otherwise threads overhead dominates.
+    _cuda_threshold = 65536;    # minimal number of oscillators for simulation on CUDA device (if it is available), otherwise transfers dominate.
+    _cuda_block_size = 256;     # number of threads in CUDA block.
+    
+    _state_type = numpy.float32;    # type of values of states, single precision is enough for PCNN and halves memory traffic.
+    _output_type = numpy.uint8;     # type of outputs of oscillators if output values fit it, otherwise type of states is used.
+    
     _params = None;
     
     
-    def __init__(self, num_osc, stimulus = None, parameters = None, type_conn = conn_type.ALL_TO_ALL, type_conn_represent = conn_represent.MATRIX):
+    def __init__(self, num_osc, stimulus = None, parameters = None, type_conn = conn_type.ALL_TO_ALL, type_conn_represent = conn_represent.MATRIX, seed = None):
         """!
         @brief Constructor of oscillatory network is based on Kuramoto model.
         
@@ -86,6 +378,7 @@ class pcnn_network(network, network_interface):
         @param[in] parameters (pcnn_parameters): Parameters of the network.
         @param[in] type_conn (conn_type): Type of connection between oscillators in the network (all-to-all, grid, bidirectional list, etc.).
         @param[in] type_conn_represent (conn_represent): Internal representation of connection in the network: matrix or list.
+        @param[in] seed (uint): Seed for generator of initial thresholds of oscillators, if it is not specified then thresholds are not reproducible.
         
         """
         
@@ -97,19 +390,26 @@ class pcnn_network(network, network_interface):
         else:
             self._params = pcnn_parameters();
         
-        self._outputs = [0.0] * self._num_osc;
+        self._outputs = numpy.zeros(self._num_osc, dtype = self.__outputs_type());
         
-        self._feeding = [0.0] * self._num_osc;    
-        self._linking = [0.0] * self._num_osc;        
-        self._threshold = [ random.random() for i in range(self._num_osc) ];
+        self._feeding = numpy.zeros(self._num_osc, dtype = self._state_type);
+        self._linking = numpy.zeros(self._num_osc, dtype = self._state_type);
+        self._threshold = numpy.random.default_rng(seed).random(self._num_osc, dtype = self._state_type);
         
         if (stimulus is None):
-            self._stimulus = [0.0] * self._num_osc;
+            self._stimulus = numpy.zeros(self._num_osc, dtype = self._state_type);
         else:
             if (len(stimulus) != self._num_osc):
                 raise NameError('Number of the stimulus should be equal to number of oscillators.');
             else:
-                self._stimulus = stimulus;
+                self._stimulus = numpy.array(stimulus, dtype = self._state_type);
+        
+        self._outputs_next = numpy.zeros(self._num_osc, dtype = self._outputs.dtype);
+        
+        self._connections = self.__create_connection_matrix();
+        self._receivers = self._connections.tocsc();
+        self._stencil = self.__create_stencil();
+        self._influence = numpy.zeros(self._num_osc, dtype = self._state_type);
     
     
     def simulate(self, steps, time = None, solution = solve_type.RK4, collect_dynamic = False):
@@ -121,8 +421,8 @@ class pcnn_network(network, network_interface):
         @param[in] solution (solve_type): Type of solution (solving).
         @param[in] collect_dynamic (bool): If True - returns whole dynamic of oscillatory network, otherwise returns only last values of dynamics.
         
-        @return (list) Dynamic of oscillatory network. If argument 'collect_dynamic' = True, than return dynamic for the whole simulation time,
-                otherwise returns only last values (last step of simulation) of dynamic.
+        @return (tuple) Time and dynamic of oscillatory network. If argument 'collect_dynamic' = True, than return dynamic for the whole simulation time
+                as array [steps + 1 x number of oscillators], otherwise returns only last values (last step of simulation) of dynamic.
         
         """
         
@@ -138,35 +438,38 @@ class pcnn_network(network, network_interface):
         @param[in] solution (solve_type): Type of solution (solving).
         @param[in] collect_dynamic (bool): If True - returns whole dynamic of oscillatory network, otherwise returns only last values of dynamics.
         
-        @return (list) Dynamic of oscillatory network. If argument 'collect_dynamic' = True, than return dynamic for the whole simulation time,
-                otherwise returns only last values (last step of simulation) of dynamic.
+        @return (tuple) Time and dynamic of oscillatory network. If argument 'collect_dynamic' = True, than return dynamic for the whole simulation time
+                as array [steps + 1 x number of oscillators], otherwise returns only last values (last step of simulation) of dynamic.
         
         """
         
         dyn_output = None;
-        # dyn_threshold = None;
-        # dyn_feeding = None;
-        # dyn_linking = None;
-        
         dyn_time = None;
         
+        # Output values of the network may be changed after creation.
+        if (self._outputs.dtype != self.__outputs_type()):
+            self._outputs = self._outputs.astype(self.__outputs_type());
+            self._outputs_next = numpy.zeros(self._outputs.shape, dtype = self._outputs.dtype);
+        
+        # Outputs of oscillators are stored row by row: initial state followed by state after each step.
         if (collect_dynamic == True):
-            dyn_output = [];
-            dyn_time = [];
+            dyn_output = numpy.empty((steps + 1,) + self._outputs.shape, dtype = self._outputs.dtype);
+            dyn_time = numpy.arange(steps + 1);
             
-            dyn_output.append(self._outputs);
-            dyn_time.append(0);
+            dyn_output[0] = self._outputs;
         
-        for step in range(0, steps, 1):
-            self._outputs = self._calculate_states(step);
-            
-            # update states of oscillators
-            if (collect_dynamic == True):
-                dyn_output.append(self._outputs);
-                dyn_time.append(step);
-            else:
-                dyn_output = self._outputs;
-                dyn_time = step;
+        # Without Fast-Linking the whole simulation is performed by compiled kernel if it is available.
+        if ( (self._params.FAST_LINKING is True) or (self._simulate_compiled(steps, dyn_output) is not True) ):
+            for step in range(0, steps, 1):
+                self._calculate_states(step);
+                
+                # update states of oscillators
+                if (collect_dynamic == True):
+                    dyn_output[step + 1] = self._outputs;
+        
+        if (collect_dynamic != True):
+            dyn_output = self._outputs.copy();
+            dyn_time = steps;
         
         self._pointer_dynamic = dyn_output;
         return (dyn_time, dyn_output);
@@ -185,98 +488,278 @@ class pcnn_network(network, network_interface):
         
     def _calculate_states(self, t):
         """!
-        @brief Calculates states of oscillators in the network for current step and stored them except outputs of oscillators.
+        @brief Calculates states of oscillators in the network for current step and stores them.
+        @details Feeding, linking and threshold are updated in-place, new outputs are written to buffer that is swapped with outputs
+                 of the previous step, so arrays are not allocated.
         
         @param[in] t (double): Can be ignored, current step of simulation.
         
-        @return (list) New outputs for oscillators (do not stored it).
+        @return (array) New outputs for oscillators, the array is reused by the network on the next steps.
         
         """
         
-        feeding = [0.0] * self._num_osc;
-        linking = [0.0] * self._num_osc;
-        outputs = [0.0] * self._num_osc;
-        threshold = [0.0] * self._num_osc;
+        feeding = self._feeding;
+        linking = self._linking;
+        threshold = self._threshold;
+        outputs = self._outputs_next;
         
-        # Used by Fast-Linking
-        output_change = False;
+        # Parameters are read once per step, constant products are folded.
+        params = self._kernel_parameters();
         
-        for index in range(0, self._num_osc, 1):
-            neighbors = self.get_neighbors(index);
-            
-            feeding_influence = 0.0;
-            linking_influence = 0.0;
-            
-            for index_neighbour in neighbors:
-                feeding_influence += self._outputs[index_neighbour] * self._params.M;
-                linking_influence += self._outputs[index_neighbour] * self._params.W;
-            
-            feeding_influence *= self._params.VF;
-            linking_influence *= self._params.VL;
-            
-            feeding[index] = self._params.AF * self._feeding[index] + self._stimulus[index] + feeding_influence;
-            linking[index] = self._params.AL * self._linking[index] + linking_influence;
-            
-            # calculate internal activity
-            internal_activity = feeding[index] * (1.0 + self._params.B * linking[index]);
-            
-            # calculate output of the oscillator
-            if (internal_activity > self._threshold[index]):
-                outputs[index] = self._params.OUTPUT_TRUE;
-            else:
-                outputs[index] = self._params.OUTPUT_FALSE;
-                
-            if (outputs[index] != self._outputs[index]):
-                output_change = True;
-            
-            # In case of Fast Linking we should calculate threshould until output is changed.
-            if (self._params.FAST_LINKING is not True):
-                threshold[index] = self._params.AT * self._threshold[index] + self._params.VT * outputs[index];
+        # Number of active neighbors of each oscillator
+        influence = self._calculate_influence(self._outputs);
+        
+        feeding *= params.AF;
+        feeding += self._stimulus;
+        feeding += influence * params.FEEDING_WEIGHT;
         
+        linking *= params.AL;
+        linking += influence * params.LINKING_WEIGHT;
+        
+        # calculate internal activity and output of each oscillator
+        internal_activity = feeding * (1.0 + params.B * linking);
+        outputs[:] = numpy.where(internal_activity > threshold, params.OUTPUT_TRUE, params.OUTPUT_FALSE);
         
         # In case of Fast Linking we need to wait until output is changed.
         if (self._params.FAST_LINKING is True):
-            current_output_change = False;
+            output_change = numpy.any(outputs != self._outputs);
+            
+            # Monotonous linking wave is stabilized at most after one change per oscillator, the limit prevents infinite cycles.
+            iteration_limit = self._num_osc + 1;
             
-            while (output_change is True):
+            while ( (output_change) and (iteration_limit > 0) ):
+                iteration_limit -= 1;
+                
                 # Save previous values
-                self._outputs = outputs[:];
+                previous_outputs = outputs.copy();
                 
-                for index in range(0, self._num_osc, 1):
-                    linking_influence = 0.0;
-            
-                    for index_neighbour in neighbors:
-                        linking_influence += self._outputs[index_neighbour] * self._params.W;
-                    
-                    linking_influence *= self._params.VL;
-                    linking[index] = linking_influence;
-                    
-                    internal_activity = feeding[index] * (1.0 + self._params.B * linking[index]);
-                    
-                    # calculate output of the oscillator
-                    if (internal_activity > self._threshold[index]):
-                        outputs[index] = self._params.OUTPUT_TRUE;
-                    else:
-                        outputs[index] = self._params.OUTPUT_FALSE;
-                        
-                    if (outputs[index] != self._outputs[index]):
-                        current_output_change = True;
+                influence = self._calculate_influence(previous_outputs);
+                linking[:] = influence * params.LINKING_WEIGHT;
+                
+                internal_activity = feeding * (1.0 + params.B * linking);
+                outputs[:] = numpy.where(internal_activity > threshold, params.OUTPUT_TRUE, params.OUTPUT_FALSE);
                 
-                output_change = current_output_change;
-                current_output_change = False;
+                output_change = numpy.any(outputs != previous_outputs);
         
-        # In case of Fast Linking threshould should be calculated after fast linking.
-        if (self._params.FAST_LINKING is True):
-            for index in range(0, self._num_osc, 1):
-                threshold[index] = self._params.AT * self._threshold[index] + self._params.VT * outputs[index];
+        # Threshold is updated after Fast Linking because the previous threshold is used during it.
+        threshold *= params.AT;
+        threshold += params.VT * outputs;
         
-        self._feeding = feeding[:];
-        self._linking = linking[:];
-        self._threshold = threshold[:];
+        (self._outputs, self._outputs_next) = (outputs, self._outputs);
         
         return outputs;
     
     
+    def _simulate_compiled(self, steps, dynamic):
+        """!
+        @brief Performs simulation without Fast-Linking by one call of compiled kernel or on CUDA device for large networks if they are available.
+        
+        @param[in] steps (uint): Number of steps of simulation.
+        @param[out] dynamic (array): Collected output dynamic [steps + 1 x number of oscillators] where the first row is already filled, None if dynamic is not collected.
+        
+        @return (bool) True if simulation is performed, False if there is no compiled kernel and simulation should be performed step by step.
+        
+        """
+        
+        if ( (CUDA_AVAILABLE is True) and (self._num_osc >= self._cuda_threshold) ):
+            self.__simulate_cuda(steps, dynamic);
+            return True;
+        
+        if ( (NUMBA_AVAILABLE is True) or (self.__native_simulation_supported() is True) ):
+            self.__simulate_cpu(steps, dynamic);
+            return True;
+        
+        return False;
+    
+    
+    def __simulate_cpu(self, steps, dynamic):
+        """!
+        @brief Performs simulation without Fast-Linking by compiled kernel, states of oscillators are updated as after calls of _calculate_states().
+        
+        @param[in] steps (uint): Number of steps of simulation.
+        @param[out] dynamic (array): Collected output dynamic [steps + 1 x number of oscillators] where the first row is already filled, None if dynamic is not collected.
+        
+        """
+        
+        if (dynamic is None):
+            dynamic = numpy.empty((0, self._num_osc), dtype = self._outputs.dtype);
+        
+        (offsets, diagonals) = self._stencil_diagonals();
+        
+        # Precompiled kernel is serial, so JIT-compiled kernel with parallel steps is preferred for large networks.
+        if ( (self.__native_simulation_supported() is True) and ( (NUMBA_AVAILABLE is not True) or (self._num_osc < self._parallel_threshold) ) ):
+            _pcnn_simulate_native(steps, self._receivers.indptr, self._receivers.indices, self._stencil is not None, offsets, diagonals, self._quiet_count(), self._stimulus,
+                                  *self._kernel_parameters(), self._feeding, self._linking, self._threshold, self._outputs, self._influence, dynamic);
+        
+        else:
+            _pcnn_simulate(steps, self._num_osc >= self._parallel_threshold, self._receivers.indptr, self._receivers.indices,
+                           self._stencil is not None, offsets, diagonals, self._quiet_count(), self._stimulus, self._kernel_parameters(),
+                           self._feeding, self._linking, self._threshold, self._outputs, self._influence, dynamic);
+    
+    
+    def _stencil_diagonals(self):
+        """!
+        @brief Returns offsets and values of diagonals of the connection matrix in DIA format, empty arrays if stencil is not used.
+        
+        """
+        
+        if (self._stencil is not None):
+            return (self._stencil.offsets, self._stencil.data);
+        
+        return (numpy.empty(0, dtype = numpy.int32), numpy.empty((0, 0), dtype = self._state_type));
+    
+    
+    def _quiet_count(self):
+        """!
+        @brief Returns maximal number of active oscillators when influence is calculated only by their connections.
+        
+        """
+        
+        return int(self._quiet_ratio * self._num_osc);
+    
+    
+    def __native_simulation_supported(self):
+        """!
+        @brief Returns True if precompiled kernel is built and types of arrays of the network correspond to its signature.
+        
+        """
+        
+        if (_pcnn_simulate_native is None):
+            return False;
+        
+        return ( (self._state_type == numpy.float32) and (self._outputs.dtype == numpy.uint8) and
+                 (self._receivers.indptr.dtype == numpy.int32) and (self._receivers.indices.dtype == numpy.int32) );
+    
+    
+    def __simulate_cuda(self, steps, dynamic):
+        """!
+        @brief Performs simulation without Fast-Linking on CUDA device, states of oscillators are updated as after calls of _calculate_states().
+        @details States are kept in memory of the device during simulation, outputs are copied to host after each step only if dynamic is collected.
+        
+        @param[in] steps (uint): Number of steps of simulation.
+        @param[out] dynamic (array): Collected output dynamic [steps + 1 x number of oscillators] where the first row is already filled, None if dynamic is not collected.
+        
+        """
+        
+        indptr = cuda.to_device(self._connections.indptr);
+        indices = cuda.to_device(self._connections.indices);
+        stimulus = cuda.to_device(self._stimulus);
+        
+        states = [ cuda.to_device(state) for state in (self._feeding, self._linking, self._threshold) ];
+        (outputs, outputs_next) = (cuda.to_device(self._outputs), cuda.device_array_like(self._outputs));
+        
+        params = self._kernel_parameters();
+        blocks = (self._num_osc + self._cuda_block_size - 1) // self._cuda_block_size;
+        
+        for step in range(0, steps, 1):
+            _pcnn_step_cuda[blocks, self._cuda_block_size](indptr, indices, outputs, stimulus, *states, *params, outputs_next);
+            
+            (outputs, outputs_next) = (outputs_next, outputs);
+            
+            if (dynamic is not None):
+                outputs.copy_to_host(dynamic[step + 1]);
+        
+        for (state, state_host) in zip(states + [ outputs ], (self._feeding, self._linking, self._threshold, self._outputs)):
+            state.copy_to_host(state_host);
+    
+    
+    def _calculate_influence(self, outputs):
+        """!
+        @brief Calculates sum of outputs of neighbors for each oscillator.
+        
+        @param[in] outputs (array): Output of each oscillator.
+        
+        @return (array) Sum of outputs of neighbors of each oscillator, the array may be reused by the network on the next call.
+        
+        """
+        
+        if (NUMBA_AVAILABLE is True):
+            (offsets, diagonals) = self._stencil_diagonals();
+            _pcnn_influence_quiet(self._receivers.indptr, self._receivers.indices, self._stencil is not None, offsets, diagonals,
+                                  self._quiet_count(), outputs, self._influence);
+            
+            return self._influence;
+        
+        # Most oscillators are quiet in typical regime, so only columns of active oscillators are used.
+        if (numpy.count_nonzero(outputs) <= self._quiet_count()):
+            active = numpy.flatnonzero(outputs);
+            return self._receivers[:, active].dot(outputs[active]);
+        
+        if (self._stencil is not None):
+            return self._stencil.dot(outputs);
+        
+        return self._connections.dot(outputs);
+    
+    
+    def _kernel_parameters(self):
+        """!
+        @brief Returns parameters of the network in the form that is expected by numerical kernels.
+        
+        """
+        
+        value = self._state_type;
+        
+        return _pcnn_kernel_parameters(FEEDING_WEIGHT = value(self._params.M * self._params.VF),
+                                       LINKING_WEIGHT = value(self._params.W * self._params.VL),
+                                       VT = value(self._params.VT),
+                                       AF = value(self._params.AF),
+                                       AL = value(self._params.AL),
+                                       AT = value(self._params.AT),
+                                       B = value(self._params.B),
+                                       OUTPUT_TRUE = value(self._params.OUTPUT_TRUE),
+                                       OUTPUT_FALSE = value(self._params.OUTPUT_FALSE));
+    
+    
+    def __create_connection_matrix(self):
+        """!
+        @brief Creates sparse matrix of connections in CSR format where element [i][j] is 1 if oscillator 'j' is neighbor of 'i'.
+        @details Neighbors of each oscillator are extracted once, so they are not requested on each step of simulation.
+        
+        @return (csr_matrix) Matrix of connections.
+        
+        """
+        
+        if (self._conn_represent == conn_represent.MATRIX):
+            return csr_matrix(numpy.array(self._osc_conn) == True, dtype = self._state_type);
+        
+        neighbors = [ self.get_neighbors(index) for index in range(self._num_osc) ];
+        
+        indptr = numpy.zeros(self._num_osc + 1, dtype = numpy.int32);
+        numpy.cumsum([ len(neighbors_oscillator) for neighbors_oscillator in neighbors ], out = indptr[1:]);
+        indices = numpy.fromiter(itertools.chain.from_iterable(neighbors), dtype = numpy.int32, count = indptr[-1]);
+        
+        return csr_matrix((numpy.ones(len(indices), dtype = self._state_type), indices, indptr), shape = (self._num_osc, self._num_osc));
+    
+    
+    def __outputs_type(self):
+        """!
+        @brief Returns type of outputs of oscillators: compact integer type if output values of the network are small non-negative integers, otherwise type of states.
+        
+        """
+        
+        for value in (self._params.OUTPUT_TRUE, self._params.OUTPUT_FALSE):
+            if ( (float(value).is_integer() is not True) or (value < 0) or (value > numpy.iinfo(self._output_type).max) ):
+                return self._state_type;
+        
+        return self._output_type;
+    
+    
+    def __create_stencil(self):
+        """!
+        @brief Creates matrix of connections in DIA format if neighbors of oscillators have a few constant offsets, for example, in case of grid.
+        
+        @return (dia_matrix) Matrix of connections where each diagonal corresponds to one offset of neighbors, None if number of offsets
+                 is greater than _stencil_max_offsets.
+        
+        """
+        
+        connections = self._connections.tocoo();
+        if (len(numpy.unique(connections.col - connections.row)) > self._stencil_max_offsets):
+            return None;
+        
+        return self._connections.todia();
+    
+    
     def allocate_sync_ensembles(self, tolerance = 10):
         """!
         @brief Allocate clusters in line with ensembles of synchronous oscillators where each
@@ -289,29 +772,14 @@ class pcnn_network(network, network_interface):
                 
         """
         
-        sync_ensembles = [];
-        traverse_oscillators = set();
-        
         if (self._pointer_dynamic is None):
             return None;
         
-        if (isinstance(self._pointer_dynamic[0], list) is not True):
+        dynamic = numpy.asarray(self._pointer_dynamic);
+        if (dynamic.ndim != 2):
             return None;
         
-        lower_boundary = 0;
-        
-        for t in range(len(self._pointer_dynamic) - 1, lower_boundary, -1):
-            sync_ensemble = [];
-            for i in range(self._num_osc):
-                if (self._pointer_dynamic[t][i] == self._params.OUTPUT_TRUE):
-                    if (i not in traverse_oscillators):
-                        sync_ensemble.append(i);
-                        traverse_oscillators.add(i);
-            
-            if (sync_ensemble != []):
-                sync_ensembles.append(sync_ensemble);
-        
-        return sync_ensembles;
+        return _pcnn_sync_ensembles(dynamic, self._params.OUTPUT_TRUE);
 
 
     def allocate_spike_ensembles(self):
@@ -327,18 +795,7 @@ class pcnn_network(network, network_interface):
         
         """
         
-        spike_ensembles = [];
-        for t in range(len(self._pointer_dynamic)):
-            spike_ensemble = [];
-            
-            for index in range(len(self)):
-                if (self._pointer_dynamic[t][index] == self._params.OUTPUT_TRUE):
-                    spike_ensemble.append(index);
-            
-            if (len(spike_ensemble) > 0):
-                spike_ensembles.append(spike_ensemble);
-        
-        return spike_ensembles;
+        return _pcnn_spike_ensembles(numpy.asarray(self._pointer_dynamic), self._params.OUTPUT_TRUE);
 
     
     def get_time_signal(self):
@@ -353,14 +810,12 @@ class pcnn_network(network, network_interface):
         @see show_time_signal()
         
         """
-        if (isinstance(self._pointer_dynamic[0], list) is not True):
-            return [ sum(self._pointer_dynamic) ];
+        dynamic = numpy.asarray(self._pointer_dynamic);
         
-        signal_vector_information = [];
-        for t in range(0, len(self._pointer_dynamic)):
-            signal_vector_information.append(sum(self._pointer_dynamic[t]));
+        if (dynamic.ndim != 2):
+            return [ float(dynamic.sum()) ];
         
-        return signal_vector_information;
+        return dynamic.sum(axis = 1, dtype = numpy.float64).tolist();
     
 
     def show_time_signal(self):
@@ -386,3 +841,157 @@ class pcnn_network(network, network_interface):
         plt.show();
         
         
+
+
+class pcnn_network_batch(pcnn_network):
+    """!
+    @brief Batch of independent pulse coupled neural networks with the same structure and parameters but different stimulus,
+           for example, for segmentation of several images of the same size. Networks are simulated together by one call of compiled kernel.
+    @details States of networks are stored in arrays [number of networks x number of oscillators], output dynamic is collected as
+             array [steps + 1 x number of networks x number of oscillators].
+    
+    """
+    
+    def __init__(self, num_osc, stimulus, parameters = None, type_conn = conn_type.ALL_TO_ALL, type_conn_represent = conn_represent.MATRIX, seed = None):
+        """!
+        @brief Constructor of batch of pulse coupled neural networks.
+        
+        @param[in] num_osc (uint): Number of oscillators in each network.
+        @param[in] stimulus (list): Stimulus of oscillators of each network: list of lists or array [number of networks x number of oscillators].
+        @param[in] parameters (pcnn_parameters): Parameters of networks.
+        @param[in] type_conn (conn_type): Type of connection between oscillators in networks (all-to-all, grid, bidirectional list, etc.).
+        @param[in] type_conn_represent (conn_represent): Internal representation of connection in networks: matrix or list.
+        @param[in] seed (uint): Seed for generator of initial thresholds of oscillators, if it is not specified then thresholds are not reproducible.
+        
+        """
+        
+        stimulus = numpy.array(stimulus, dtype = self._state_type);
+        if ( (stimulus.ndim != 2) or (stimulus.shape[1] != num_osc) ):
+            raise NameError('Stimulus should be specified for each oscillator of each network.');
+        
+        super().__init__(num_osc, None, parameters, type_conn, type_conn_represent, seed);
+        
+        self._stimulus = stimulus;
+        
+        self._outputs = numpy.zeros(stimulus.shape, dtype = self._outputs.dtype);
+        self._outputs_next = numpy.zeros(stimulus.shape, dtype = self._outputs.dtype);
+        
+        self._feeding = numpy.zeros(stimulus.shape, dtype = self._state_type);
+        self._linking = numpy.zeros(stimulus.shape, dtype = self._state_type);
+        self._threshold = numpy.random.default_rng(seed).random(stimulus.shape, dtype = self._state_type);
+        
+        self._influence = numpy.zeros(stimulus.shape, dtype = self._state_type);
+    
+    
+    def simulate(self, steps, time = None, solution = solve_type.RK4, collect_dynamic = False):
+        """!
+        @brief Performs static simulation of batch of pulse coupled neural networks.
+        
+        @param[in] steps (uint): Number steps of simulations during simulation.
+        @param[in] time (double): Can be ingored - steps are used instead of time of simulation.
+        @param[in] solution (solve_type): Type of solution (solving).
+        @param[in] collect_dynamic (bool): If True - returns whole dynamic of networks, otherwise returns only last values of dynamics.
+        
+        @return (tuple) Time and dynamic of networks. If argument 'collect_dynamic' = True, than return dynamic for the whole simulation time
+                as array [steps + 1 x number of networks x number of oscillators], otherwise returns only last values (last step of simulation)
+                of dynamic as array [number of networks x number of oscillators].
+        
+        """
+        
+        return self.simulate_static(steps, time, solution, collect_dynamic);
+    
+    
+    def _simulate_compiled(self, steps, dynamic):
+        """!
+        @brief Performs simulation of all networks without Fast-Linking by one call of compiled kernel if Numba is available.
+        
+        @param[in] steps (uint): Number of steps of simulation.
+        @param[out] dynamic (array): Collected output dynamic [steps + 1 x number of networks x number of oscillators] where the first row is already filled, None if dynamic is not collected.
+        
+        @return (bool) True if simulation is performed, False if simulation should be performed step by step.
+        
+        """
+        
+        if (NUMBA_AVAILABLE is not True):
+            return False;
+        
+        if (dynamic is None):
+            dynamic = numpy.empty((0,) + self._outputs.shape, dtype = self._outputs.dtype);
+        
+        (offsets, diagonals) = self._stencil_diagonals();
+        
+        _pcnn_simulate_batch(steps, self._receivers.indptr, self._receivers.indices, self._stencil is not None, offsets, diagonals, self._quiet_count(),
+                             self._stimulus, self._kernel_parameters(), self._feeding, self._linking, self._threshold, self._outputs, self._influence, dynamic);
+        
+        return True;
+    
+    
+    def _calculate_influence(self, outputs):
+        """!
+        @brief Calculates sum of outputs of neighbors for each oscillator of each network.
+        
+        @param[in] outputs (array): Outputs of oscillators [number of networks x number of oscillators].
+        
+        @return (array) Sum of outputs of neighbors of each oscillator [number of networks x number of oscillators].
+        
+        """
+        
+        connections = self._connections;
+        if (self._stencil is not None):
+            connections = self._stencil;
+        
+        return connections.dot(outputs.T).T;
+    
+    
+    def allocate_sync_ensembles(self, tolerance = 10):
+        """!
+        @brief Allocate clusters in line with ensembles of synchronous oscillators for each network.
+        
+        @param[in] tolerance (double): Is not used, can be ignored.
+        
+        @return (list) Synchronous ensembles of each network (see pcnn_network.allocate_sync_ensembles()).
+        
+        """
+        
+        if (self._pointer_dynamic is None):
+            return None;
+        
+        dynamic = numpy.asarray(self._pointer_dynamic);
+        if (dynamic.ndim != 3):
+            return None;
+        
+        return [ _pcnn_sync_ensembles(dynamic[:, index_network], self._params.OUTPUT_TRUE) for index_network in range(dynamic.shape[1]) ];
+    
+    
+    def allocate_spike_ensembles(self):
+        """!
+        @brief Analyses output dynamic of networks and allocates spikes on each iteration for each network.
+        
+        @return (list) Spike ensembles of oscillators of each network (see pcnn_network.allocate_spike_ensembles()).
+        
+        """
+        
+        dynamic = numpy.asarray(self._pointer_dynamic);
+        if (dynamic.ndim != 3):
+            dynamic = dynamic[numpy.newaxis];
+        
+        return [ _pcnn_spike_ensembles(dynamic[:, index_network], self._params.OUTPUT_TRUE) for index_network in range(dynamic.shape[1]) ];
+    
+    
+    def get_time_signal(self):
+        """!
+        @brief Calculates time signal (signal vector information) of output of each network.
+        
+        @return (list) Time signal of networks: list [steps + 1] of lists [number of networks].
+        
+        @see simulate()
+        @see show_time_signal()
+        
+        """
+        
+        dynamic = numpy.asarray(self._pointer_dynamic);
+        
+        if (dynamic.ndim != 3):
+            return [ dynamic.sum(axis = 1, dtype = numpy.float64).tolist() ];
+        
+        return dynamic.sum(axis = 2, dtype = numpy.float64).tolist();
@@ -24,6 +24,7 @@
 """
 
 import unittest;
+import numpy;
 
 from pyclustering.support import extract_number_oscillations;
 
@@ -32,7 +33,7 @@ from pyclustering.nnet.hhn import hhn_network, hhn_parameters;
 class Test(unittest.TestCase):
     # Tests regarded to synchronous ensembles allocation.
     def templateSyncEnsembleAllocation(self, stimulus, params, sim_steps, sim_time, expected_clusters):
-        net = hhn_network(len(stimulus), stimulus, params);
+        net = hhn_network(len(stimulus), stimulus, params, seed = 2);
         (t, x) = net.simulate(sim_steps, sim_time);
         
         ensembles = net.allocate_sync_ensembles(0.2);
@@ -46,6 +47,43 @@ class Test(unittest.TestCase):
     
     def testPartialSync(self):
         self.templateSyncEnsembleAllocation([25, 25, 45, 45], None, 400, 200, [ [0, 1], [2, 3] ]);
+    
+    def testSeedReproducibility(self):
+        (t, dyn1) = hhn_network(4, [25, 25, 45, 45], seed = 1).simulate(100, 50);
+        (t, dyn2) = hhn_network(4, [25, 25, 45, 45], seed = 1).simulate(100, 50);
+        
+        assert dyn1 == dyn2;
+    
+    def testLargeNetworkStability(self):
+        # Synaptic conductance of central element grows with number of peripheral oscillators.
+        net = hhn_network(200, [25] * 200, seed = 1);
+        (t, dyn) = net.simulate(200, 100);
+        
+        assert numpy.isfinite(dyn).all();
+    
+    def testStateOfOscillator(self):
+        net = hhn_network(3, [10, 20, 30], seed = 1);
+        net.simulate(50, 20);
+        
+        states = numpy.concatenate((net._membrane_potential, net._cn_membrane_potential, net._active_cond_sodium, net._cn_active_cond_sodium,
+                                    net._inactive_cond_sodium, net._cn_inactive_cond_sodium, net._active_cond_potassium, net._cn_active_cond_potassium));
+        
+        derivatives = net.hnn_state(states, 20.1);
+        
+        # Derivatives of one oscillator (peripheral or central) are the same as derivatives of the whole network.
+        for index in range(5):
+            assert numpy.allclose(net.hnn_state(states[index::5].tolist(), 20.1, index), derivatives[index::5]);
+    
+    # Tests regarded to parameters of the network.
+    def testParametersNoiseOfInstance(self):
+        first_params = hhn_parameters();
+        second_params = hhn_parameters();
+        
+        assert first_params.nu != second_params.nu;
+        assert first_params.gNa == 120.0 * (1 + 0.02 * first_params.nu);
+        assert second_params.gNa == 120.0 * (1 + 0.02 * second_params.nu);
+        
+        assert hhn_parameters(1).nu == hhn_parameters(1).nu;
 
 if __name__ == "__main__":
     unittest.main();
\ No newline at end of file
@@ -20,8 +20,9 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
 import unittest;
+import numpy;
 
-from pyclustering.nnet.pcnn import pcnn_network, pcnn_parameters;
+from pyclustering.nnet.pcnn import pcnn_network, pcnn_network_batch, pcnn_parameters;
 from pyclustering.nnet import *;
 
 class Test(unittest.TestCase):
@@ -59,6 +60,137 @@ class Test(unittest.TestCase):
 
         assert [ [6, 7, 8, 11, 12, 13, 16, 17, 18] ] == sync_ensebles;
 
+    def templateFastLinkingWave(self, fast_linking, expected_outputs):
+        params = pcnn_parameters();
+        params.B = 1000000.0;
+        params.FAST_LINKING = fast_linking;
+        
+        # Only the first oscillator is able to fire itself, others are excited by linking with fired neighbors.
+        net = pcnn_network(5, [1.0, 0.000001, 0.000001, 0.000001, 0.000001], params, type_conn = conn_type.LIST_BIDIR);
+        (t, dyn) = net.simulate(1, collect_dynamic = True);
+        
+        assert expected_outputs == list(dyn[-1]);
+
+    def testFastLinkingWaveWithinStep(self):
+        self.templateFastLinkingWave(True, [1, 1, 1, 1, 1]);
+
+    def testLinkingWaveWithoutFastLinking(self):
+        self.templateFastLinkingWave(False, [1, 0, 0, 0, 0]);
+
+    def testSeedReproducibility(self):
+        stimulus = [0.3, 0.8, 0.5, 0.9, 0.1, 0.6, 0.2, 0.7, 0.4];
+        
+        (t, dyn1) = pcnn_network(9, stimulus, type_conn = conn_type.GRID_FOUR, seed = 1).simulate(20, collect_dynamic = True);
+        (t, dyn2) = pcnn_network(9, stimulus, type_conn = conn_type.GRID_FOUR, seed = 1).simulate(20, collect_dynamic = True);
+        
+        assert dyn1.tolist() == dyn2.tolist();
+
+    def templateDynamicCollection(self, fast_linking):
+        params = pcnn_parameters();
+        params.FAST_LINKING = fast_linking;
+        
+        stimulus = [0.3, 0.8, 0.5, 0.9, 0.1, 0.6, 0.2, 0.7, 0.4];
+        
+        (t, dyn) = pcnn_network(9, stimulus, params, type_conn = conn_type.GRID_FOUR, seed = 2).simulate(10, collect_dynamic = True);
+        assert len(set([ tuple(outputs) for outputs in dyn.tolist() ])) > 1;
+        
+        # Each collected state should be the same as the state that is returned after corresponding step.
+        net = pcnn_network(9, stimulus, params, type_conn = conn_type.GRID_FOUR, seed = 2);
+        for step in range(10):
+            (t, outputs) = net.simulate(1);
+            assert dyn[step + 1].tolist() == outputs.tolist();
+    
+    def testDynamicCollection(self):
+        self.templateDynamicCollection(False);
+    
+    def testDynamicCollectionFastLinking(self):
+        self.templateDynamicCollection(True);
+    
+    def templateQuietInfluence(self, type_conn, fast_linking):
+        params = pcnn_parameters();
+        params.FAST_LINKING = fast_linking;
+        
+        stimulus = [0.3, 0.8, 0.5, 0.9, 0.1, 0.6, 0.2, 0.7, 0.4, 1.0, 0.0, 0.9, 0.6, 0.3, 0.8, 0.2];
+        
+        # Influence is calculated only by connections of active oscillators if quiet ratio is 1.0 and by the whole connection matrix if it is 0.0.
+        dynamics = [];
+        for quiet_ratio in [1.0, 0.0]:
+            net = pcnn_network(16, stimulus, params, type_conn, seed = 4);
+            net._quiet_ratio = quiet_ratio;
+            
+            (t, dyn) = net.simulate(20, collect_dynamic = True);
+            dynamics.append(dyn.tolist());
+        
+        assert dyn[1:].any();
+        assert dynamics[0] == dynamics[1];
+        
+        net._quiet_ratio = 1.0;
+        outputs = (numpy.random.default_rng(5).random(16) < 0.5).astype(net._outputs.dtype);
+        
+        assert numpy.array_equal(net._calculate_influence(outputs), net._connections.dot(outputs.astype(float)));
+    
+    def testQuietInfluenceGrid(self):
+        self.templateQuietInfluence(conn_type.GRID_FOUR, False);
+    
+    def testQuietInfluenceGridFastLinking(self):
+        self.templateQuietInfluence(conn_type.GRID_FOUR, True);
+    
+    def testQuietInfluenceAllToAll(self):
+        self.templateQuietInfluence(conn_type.ALL_TO_ALL, False);
+    
+    def testQuietInfluenceAllToAllFastLinking(self):
+        self.templateQuietInfluence(conn_type.ALL_TO_ALL, True);
+    
+    def testSimulationResultTypes(self):
+        net = pcnn_network(4, [1.0, 0.0, 1.0, 0.0], seed = 1);
+        
+        (t, dyn) = net.simulate(3, collect_dynamic = True);
+        assert t.tolist() == [0, 1, 2, 3];
+        assert isinstance(dyn, numpy.ndarray);
+        assert dyn.dtype == numpy.uint8;
+        assert dyn.shape == (4, 4);
+        
+        signal = net.get_time_signal();
+        assert len(signal) == 4;
+        assert all([ isinstance(value, float) for value in signal ]);
+        
+        (t, dyn) = net.simulate(3);
+        assert t == 3;
+        assert dyn.dtype == numpy.uint8;
+        assert dyn.shape == (4, );
+        
+        params = pcnn_parameters();
+        params.OUTPUT_TRUE = 0.5;
+        
+        (t, dyn) = pcnn_network(4, [1.0, 0.0, 1.0, 0.0], params, seed = 1).simulate(3, collect_dynamic = True);
+        assert dyn.dtype == numpy.float32;
+    
+    def templateBatchSimulation(self, fast_linking):
+        params = pcnn_parameters();
+        params.FAST_LINKING = fast_linking;
+        
+        stimulus = [ [0.3, 0.8, 0.5, 0.9, 0.1, 0.6, 0.2, 0.7, 0.4], [0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 0.0, 0.0, 0.0] ];
+        
+        net = pcnn_network_batch(9, stimulus, params, type_conn = conn_type.GRID_FOUR, seed = 3);
+        (t, dyn) = net.simulate(10, collect_dynamic = True);
+        assert dyn.shape == (11, 2, 9);
+        
+        # The first network of the batch has the same initial thresholds as single network with the same seed.
+        (t, dyn_single) = pcnn_network(9, stimulus[0], params, type_conn = conn_type.GRID_FOUR, seed = 3).simulate(10, collect_dynamic = True);
+        assert dyn[:, 0].tolist() == dyn_single.tolist();
+        
+        assert len(net.allocate_sync_ensembles()) == 2;
+        assert len(net.get_time_signal()) == 11;
+    
+    def testBatchSimulation(self):
+        self.templateBatchSimulation(False);
+    
+    def testBatchSimulationFastLinking(self):
+        self.templateBatchSimulation(True);
+    
+    def testBatchWrongStimulus(self):
+        self.assertRaises(NameError, pcnn_network_batch, 9, [0.0] * 9);
+
 
 if __name__ == "__main__":
     unittest.main();
\ No newline at end of file
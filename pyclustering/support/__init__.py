@@ -582,7 +582,7 @@ def draw_dynamics(t, dyn, x_title = None, y_title = None, x_lim = None, y_lim =
     @details It draws if matplotlib is not specified (None), othewise it should be performed manually.
     
     @param[in] t (list): Values of time (used by x axis).
-    @param[in] dyn (list): Values of output of oscillators (used by y axis).
+    @param[in] dyn (list): Values of output of oscillators (used by y axis), list of lists or 2-D array if there are several oscillators.
     @param[in] x_title (string): Title for Y.
     @param[in] y_title (string): Title for X.
     @param[in] x_lim (double): X limit.
@@ -599,7 +599,7 @@ def draw_dynamics(t, dyn, x_title = None, y_title = None, x_lim = None, y_lim =
     number_lines = 0;
     
     if ( (isinstance(separate, bool) is True) and (separate is True) ):
-        if (isinstance(dyn[0], list) is True):
+        if (isinstance(dyn[0], (list, numpy.ndarray)) is True):
             number_lines = len(dyn[0]);
         else:
             number_lines = 1;
@@ -616,7 +616,7 @@ def draw_dynamics(t, dyn, x_title = None, y_title = None, x_lim = None, y_lim =
         (fig, axes) = plt.subplots(number_lines, 1);
     
     # Check if we have more than one dynamic
-    if (isinstance(dyn[0], list) is True):
+    if (isinstance(dyn[0], (list, numpy.ndarray)) is True):
         num_items = len(dyn[0]);
         for index in range(0, num_items, 1):       
             y = [item[index] for item in dyn];
@@ -0,0 +1,73 @@
+"""!
+
+@brief Optional just-in-time compilation of numerical kernels using Numba.
+@details Numba is not required by pyclustering: if it is not installed then kernels that are decorated by jit() are
+         executed by Python interpreter as usual functions and prange is the same as built-in range.
+         CUDA kernels are used only if CUDA_AVAILABLE is True, i.e. Numba is installed and CUDA device is detected,
+         otherwise cuda is None.
+
+@authors Andrei Novikov (spb.andr@yandex.ru)
+@date 2014-2015
+@copyright GNU Public License
+
+@cond GNU_PUBLIC_LICENSE
+    PyClustering is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+    
+    PyClustering is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+@endcond
+
+"""
+
+try:
+    import numba;
+    NUMBA_AVAILABLE = True;
+except ImportError:
+    NUMBA_AVAILABLE = False;
+
+
+if (NUMBA_AVAILABLE is True):
+    prange = numba.prange;
+else:
+    prange = range;
+
+
+cuda = None;
+CUDA_AVAILABLE = False;
+
+if (NUMBA_AVAILABLE is True):
+    try:
+        from numba import cuda;
+        CUDA_AVAILABLE = cuda.is_available();
+    except Exception:
+        CUDA_AVAILABLE = False;
+
+
+def jit(**options):
+    """!
+    @brief Returns decorator that compiles function in nopython mode if Numba is available, otherwise function is returned as is.
+
+    @param[in] options (dict): Options of compilation that are passed to numba.njit(), for example, cache = True, fastmath = True.
+
+    @return (function) Decorator for numerical kernel.
+
+    @code
+        @jit(cache = True, fastmath = True)
+        def kernel(values):
+            return values * 2.0;
+    @endcode
+
+    """
+
+    if (NUMBA_AVAILABLE is True):
+        return numba.njit(**options);
+
+    return lambda function: function;